@@ -1,7 +1,11 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from utils import db_metrics, executors
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
@@ -11,15 +15,67 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# SSL нужен только PostgreSQL (на Render - обязательно); для локального SQLite не передаём
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+
+# Пул асинхронного движка (им пользуются роутеры)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Синхронный движок нужен на старте и для счётчиков ссылок хранилища: их берут потоки
+# STORAGE_POOL (save_with_derivatives сохраняет 7 объектов сразу) - по соединению на поток
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", str(executors.STORAGE_POOL_SIZE)))
+DB_SYNC_MAX_OVERFLOW = int(os.getenv("DB_SYNC_MAX_OVERFLOW", "2"))
+# pre-ping - лишний SELECT 1 на каждую выдачу; при коротком pool_recycle его можно выключить
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+
+_url = make_url(DATABASE_URL)
+IS_SQLITE = _url.get_backend_name() == "sqlite"
+
+
+def _sync_connect_args() -> dict:
+    if IS_SQLITE:
+        # Сессии ходят в БД из пулов потоков
+        return {"check_same_thread": False}
+    if "sslmode" in _url.query:
+        return {}
+    return {"sslmode": DB_SSLMODE}
+
+
+def _async_url_and_args():
+    """
+    Тот же DATABASE_URL, но с асинхронным драйвером: asyncpg для PostgreSQL, aiosqlite для SQLite.
+    asyncpg не понимает sslmode в URL - переносим его в connect_args как ssl.
+    """
+    if IS_SQLITE:
+        return _url.set(drivername="sqlite+aiosqlite"), {}
+    sslmode = _url.query.get("sslmode", DB_SSLMODE)
+    url = _url.difference_update_query(["sslmode"]).set(drivername="postgresql+asyncpg")
+    return url, ({} if sslmode == "disable" else {"ssl": sslmode})
+
+
+def _pool_args(name: str, is_async: bool, pool_size: int, max_overflow: int) -> dict:
+    """Настройки пула; для PostgreSQL - QueuePool с метриками ожидания (utils/db_metrics.py)"""
+    args = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if not IS_SQLITE:
+        args.update(
+            poolclass=db_metrics.instrumented_pool_class(name, is_async),
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return args
+
+
 # 🔥 ДОБАВЛЕНЫ ПАРАМЕТРЫ SSL И POOL ДЛЯ RENDER POSTGRESQL
+# Синхронный движок: create_all/миграции при старте и код, работающий в потоках
 engine = create_engine(
     DATABASE_URL,
-    connect_args={
-        "sslmode": "require",  # Обязательно для Render PostgreSQL
-    },
-    pool_pre_ping=True,      # Проверка соединения перед использованием
-    pool_recycle=3600,       # Пересоздание соединений каждый час
+    connect_args=_sync_connect_args(),
+    **_pool_args("sync", False, DB_SYNC_POOL_SIZE, DB_SYNC_MAX_OVERFLOW)
 )
+db_metrics.attach("sync", engine)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -27,6 +83,23 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# Асинхронный движок для роутеров: запросы не блокируют event loop
+ASYNC_DATABASE_URL, _async_connect_args = _async_url_and_args()
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=_async_connect_args,
+    **_pool_args("async", True, DB_POOL_SIZE, DB_MAX_OVERFLOW)
+)
+db_metrics.attach("async", async_engine.sync_engine)
+
+# expire_on_commit=False: после commit объекты можно отдавать в ответ без ленивой загрузки
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 # ---- Dependency for FastAPI ----
@@ -36,3 +109,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -3,8 +3,13 @@
 Безопасно пересоздает таблицы только если структура изменилась
 """
 import os
-from sqlalchemy import create_engine, inspect
-from database import Base, DATABASE_URL
+import re
+import sys
+import json
+import argparse
+from sqlalchemy import create_engine, inspect, text, select
+from sqlalchemy.schema import CreateIndex
+from database import Base, DATABASE_URL, engine as app_engine
 import models
 
 def init_database():
@@ -29,6 +34,8 @@ def init_database():
             Base.metadata.create_all(bind=engine)
             print("✅ Таблицы успешно пересозданы!")
         else:
+            Base.metadata.create_all(bind=engine)
+            upgrade_schema(engine)
             print("✅ Структура БД актуальна")
     else:
         # Таблиц нет - создаём с нуля
@@ -36,5 +43,164 @@ def init_database():
         Base.metadata.create_all(bind=engine)
         print("✅ Таблицы созданы!")
 
+def upgrade_schema(engine):
+    """
+    Аддитивная миграция: добавляет в существующие таблицы колонки, которые
+    появились в models.py. Ничего не удаляет и не меняет типы существующих колонок.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'
+                # Старые строки получают server_default; без него колонка остаётся nullable
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                print(f"➕ {table.name}.{column.name} ({col_type}) добавлена")
+    
+    create_missing_indexes(engine, existing_tables)
+    backfill_look_items(engine)
+
+# Ключ advisory-блокировки: индексы строит только один воркер
+INDEX_BUILD_LOCK_KEY = 720_250_001
+
+def create_missing_indexes(engine, existing_tables):
+    """
+    Создаёт индексы из models.py, которых нет в уже существующих таблицах
+    (create_all создаёт их только вместе с новой таблицей).
+    В PostgreSQL - CREATE INDEX CONCURRENTLY вне транзакции: запись в таблицу не блокируется.
+    """
+    indexes = [
+        index
+        for table in Base.metadata.sorted_tables if table.name in existing_tables
+        for index in table.indexes
+    ]
+    if engine.dialect.name != "postgresql":
+        inspector = inspect(engine)
+        for index in indexes:
+            if index.name not in {ix['name'] for ix in inspector.get_indexes(index.table.name)}:
+                index.create(bind=engine, checkfirst=True)
+                print(f"📇 Индекс {index.name} создан")
+        return
+    
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": INDEX_BUILD_LOCK_KEY}).scalar():
+            print("⏭️ Индексы уже строит другой процесс")
+            return
+        try:
+            for index in indexes:
+                is_valid = conn.execute(text(
+                    "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name"
+                ), {"name": index.name}).scalar()
+                if is_valid:
+                    continue
+                if is_valid is False:
+                    # Прерванная сборка CONCURRENTLY оставляет невалидный индекс - пересобираем
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                ddl = str(CreateIndex(index).compile(dialect=engine.dialect)).strip()
+                conn.execute(text(re.sub(r"^CREATE (UNIQUE )?INDEX", r"CREATE \1INDEX CONCURRENTLY", ddl)))
+                print(f"📇 Индекс {index.name} создан")
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INDEX_BUILD_LOCK_KEY})
+
+def backfill_look_items(engine):
+    """
+    Переносит состав луков из CSV looks.items_ids в look_items.
+    Берёт только луки без строк в look_items, поэтому повторный запуск ничего не делает.
+    Вещи чужих пользователей и удалённые вещи пропускаются.
+    """
+    with engine.begin() as conn:
+        looks = conn.execute(text(
+            "SELECT id, user_id, items_ids FROM looks "
+            "WHERE items_ids IS NOT NULL AND items_ids <> '' "
+            "AND NOT EXISTS (SELECT 1 FROM look_items li WHERE li.look_id = looks.id)"
+        )).fetchall()
+        if not looks:
+            return
+        
+        parsed = {look.id: models.parse_items_ids(look.items_ids) for look in looks}
+        all_ids = sorted({item_id for ids in parsed.values() for item_id in ids})
+        owners = {}
+        for i in range(0, len(all_ids), 1000):
+            chunk = all_ids[i:i + 1000]
+            rows = conn.execute(
+                select(models.WardrobeItem.id, models.WardrobeItem.user_id).where(models.WardrobeItem.id.in_(chunk))
+            ).fetchall()
+            owners.update({row.id: row.user_id for row in rows})
+        
+        rows = [
+            {"look_id": look.id, "item_id": item_id, "position": position}
+            for look in looks
+            for position, item_id in enumerate(
+                item_id for item_id in parsed[look.id] if owners.get(item_id) == look.user_id
+            )
+        ]
+        if rows:
+            conn.execute(models.LookItem.__table__.insert(), rows)
+        print(f"🔗 look_items: перенесено {len(rows)} связей из {len(looks)} луков")
+
+# Списки "новые сверху" из роутеров: должны идти по индексу (user_id, id DESC) без сортировки
+LIST_QUERIES = {
+    "wardrobe.get_items": "SELECT * FROM wardrobe WHERE user_id = :user_id ORDER BY id DESC LIMIT 101",
+    "wardrobe.get_items (cursor)": "SELECT * FROM wardrobe WHERE user_id = :user_id AND id < :before_id ORDER BY id DESC LIMIT 101",
+    "looks.get_looks": "SELECT * FROM looks WHERE user_id = :user_id ORDER BY id DESC",
+    "profile.get_analyses": "SELECT * FROM analyses WHERE user_id = :user_id ORDER BY id DESC LIMIT 20",
+}
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+def explain_list_queries(engine) -> bool:
+    """
+    Печатает планы LIST_QUERIES и возвращает False, если хоть один план сортирует
+    (Sort в PostgreSQL, USE TEMP B-TREE FOR ORDER BY в SQLite).
+    """
+    is_postgres = engine.dialect.name == "postgresql"
+    params = {"user_id": 0, "before_id": 2 ** 31 - 1}
+    ok = True
+    with engine.connect() as conn, conn.begin():
+        if is_postgres:
+            # На маленькой таблице планировщик предпочтёт seq scan + sort;
+            # проверяем, что порядок вообще может дать индекс
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, sql in LIST_QUERIES.items():
+            if is_postgres:
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                nodes = list(_plan_nodes(plan[0]["Plan"]))
+                has_sort = any(n["Node Type"] in ("Sort", "Incremental Sort") for n in nodes)
+                detail = " -> ".join(
+                    n["Node Type"] + (f" ({n['Index Name']})" if "Index Name" in n else "") for n in nodes
+                )
+            else:
+                rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+                detail = "; ".join(str(row[-1]) for row in rows)
+                has_sort = "TEMP B-TREE" in detail
+            print(f"{'❌' if has_sort else '✅'} {name}: {detail}")
+            ok = ok and not has_sort
+    return ok
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Инициализация и проверка структуры БД")
+    parser.add_argument("--explain", action="store_true",
+                        help="только проверить, что списки пользователя идут по индексу без Sort")
+    args = parser.parse_args()
+    
+    if args.explain:
+        sys.exit(0 if explain_list_queries(app_engine) else 1)
     init_database()
@@ -15,10 +15,13 @@ sys.path.insert(0, project_dir)
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from routers import auth, wardrobe, api_auth, tg_auth
-from database import Base, engine
+from routers import auth, wardrobe, api_auth, tg_auth, internal
+from database import Base, engine, async_engine
+from init_db import upgrade_schema
+from utils.clip_client import CLIP_CLIENT
+from utils import executors
+from utils.static_files import ImmutableStaticFiles
 
 app = FastAPI(title="Stylist Backend")
 
@@ -33,31 +36,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Клиент читает ETag для If-None-Match и курсор следующей страницы гардероба
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("🚀 ЗАПУСК СЕРВЕРА...")
+    executors.start_pools()
     try:
         Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine)
         logger.info("✅ Таблицы базы данных проверены/созданы")
     except Exception as e:
         logger.error(f"❌ ОШИБКА БД ПРИ СТАРТЕ: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await CLIP_CLIENT.close()
+    await async_engine.dispose()
+    executors.shutdown_pools()
+
 @app.get("/")
 def root():
     return {"status": "running", "docs": "/docs"}
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "clip": CLIP_CLIENT.status(), "pools": executors.pools_info()}
 
 # Статика
 static_path = os.path.join(project_dir, "static")
 os.makedirs(os.path.join(static_path, "images"), exist_ok=True)
-app.mount("/static", StaticFiles(directory=static_path), name="static")
+# Картинки в static/images не меняются после записи - отдаём с immutable-кэшем и ETag
+app.mount("/static", ImmutableStaticFiles(directory=static_path), name="static")
 
 # Роутеры
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(tg_auth.router, prefix="/api/auth", tags=["telegram_auth"])
 app.include_router(wardrobe.router, prefix="/api/wardrobe", tags=["wardrobe"])
+app.include_router(internal.router, prefix="/internal", include_in_schema=False)
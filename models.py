@@ -1,6 +1,6 @@
 # models.py
 
-from sqlalchemy import Column, Integer, String, BigInteger, ForeignKey, Text, DateTime
+from sqlalchemy import Column, Integer, String, BigInteger, ForeignKey, Text, DateTime, JSON, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -22,6 +22,8 @@ class User(Base):
     subscription_type = Column(String, default="free") 
     subscription_until = Column(DateTime, nullable=True)
     trial_used = Column(Integer, default=0)
+    # Растёт при каждом изменении гардероба - из него строится ETag для /api/wardrobe/items
+    wardrobe_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Связь с гардеробом
     wardrobe = relationship("WardrobeItem", back_populates="owner", cascade="all, delete-orphan")
@@ -36,11 +38,18 @@ class WardrobeItem(Base):
     name = Column(String, nullable=False)
     item_type = Column(String, nullable=True)
     image_url = Column(Text, nullable=False)
+    # Уменьшенные копии: {"grid": {"webp": url, "jpeg": url, "width": w, "height": h}, "card": ..., "full": ...}
+    image_variants = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Связь с владельцем
     owner = relationship("User", back_populates="wardrobe")
 
+    # Списки "новые сверху" одного пользователя идут по индексу без сортировки
+    __table_args__ = (
+        Index("ix_wardrobe_user_id_id_desc", user_id, id.desc()),
+    )
+
 
 class Look(Base):
     __tablename__ = "looks"
@@ -48,12 +57,43 @@ class Look(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(BigInteger, ForeignKey("users.tg_id"), nullable=False, index=True)
     look_name = Column(String, nullable=True)
-    items_ids = Column(Text, nullable=True) # Храним IDs элементов гардероба (например, "1,5,12")
+    items_ids = Column(Text, nullable=True) # Храним IDs элементов гардероба (например, "1,5,12") - для старых клиентов
     occasion = Column(String, nullable=True)
     image_url = Column(Text, nullable=True)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Состав лука: строки look_items (запись) и сами вещи в порядке position (чтение, selectinload)
+    look_items = relationship("LookItem", order_by="LookItem.position", cascade="all, delete-orphan")
+    items = relationship("WardrobeItem", secondary="look_items", order_by="LookItem.position", viewonly=True)
+
+    __table_args__ = (
+        Index("ix_looks_user_id_id_desc", user_id, id.desc()),
+    )
+
+
+def parse_items_ids(items_ids) -> list:
+    """Look.items_ids "1, 5,12" -> [1, 5, 12]: мусор и повторы отбрасываются, порядок сохраняется"""
+    ids = []
+    for part in (items_ids or "").split(","):
+        part = part.strip()
+        if part.isdigit() and int(part) not in ids:
+            ids.append(int(part))
+    return ids
+
+
+class LookItem(Base):
+    """Вещь гардероба в луке. PK (look_id, item_id) - вещи лука, индекс (item_id, look_id) - луки с вещью"""
+    __tablename__ = "look_items"
+
+    look_id = Column(Integer, ForeignKey("looks.id", ondelete="CASCADE"), primary_key=True)
+    item_id = Column(Integer, ForeignKey("wardrobe.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_look_items_item_look", "item_id", "look_id"),
+    )
+
 
 class Profile(Base):
     __tablename__ = "profiles"
@@ -73,3 +113,17 @@ class Analysis(Base):
     photo_id = Column(String, nullable=False) # ID файла в Telegram
     analysis_text = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_analyses_user_id_id_desc", user_id, id.desc()),
+    )
+
+
+class StoredObject(Base):
+    """Счётчик ссылок на контентно-адресуемые картинки (utils/storage.py, STORAGE_DEDUP=1)"""
+    __tablename__ = "stored_objects"
+
+    key = Column(String, primary_key=True)  # <sha256>.<ext>
+    refcount = Column(Integer, nullable=False, default=0)
+    size = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
 # ИСПРАВЛЕНО: Заменены относительные импорты на абсолютные
-from database import get_db
+from database import get_async_db
 from models import User # Теперь импортируем из корневого models.py
 # ВНИМАНИЕ: Предполагается, что у вас есть schemas.py в корне проекта
 from schemas import APILogin, Token 
@@ -14,19 +16,20 @@ from utils.auth import get_current_user_id # Теперь импортируем
 router = APIRouter(tags=["API Auth"])
 
 @router.post("/register", response_model=Token)
-def register_api_user(user_data: APILogin, db: Session = Depends(get_db)):
+async def register_api_user(user_data: APILogin, db: AsyncSession = Depends(get_async_db)):
     # 1. Проверка, существует ли пользователь по username
-    db_user = db.query(User).filter(User.username == user_data.username).first()
+    db_user = (await db.execute(select(User).where(User.username == user_data.username))).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Пользователь с таким именем уже существует.")
     
     # 2. Хешируем пароль
-    hashed_password = get_password_hash(user_data.password)
+    # bcrypt медленный по задумке - считаем в потоке, чтобы не блокировать event loop
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     
     # 3. Создаем нового пользователя
     # CRITICAL FIX: Генерация уникального ОТРИЦАТЕЛЬНОГО tg_id для API-only пользователей
     # Находим наименьший (наиболее отрицательный) существующий ID API-пользователя
-    last_api_tg_id = db.query(func.min(User.tg_id)).filter(User.tg_id < 0).scalar()
+    last_api_tg_id = (await db.execute(select(func.min(User.tg_id)).where(User.tg_id < 0))).scalar()
     # Если нет отрицательных ID, начинаем с -1, иначе -1 от самого отрицательного
     new_tg_id = (last_api_tg_id or 0) - 1
     
@@ -40,8 +43,8 @@ def register_api_user(user_data: APILogin, db: Session = Depends(get_db)):
     ) 
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # 4. Генерируем токен, используя новый tg_id
     access_token = create_access_token(data={"sub": new_user.username, "user_id": new_user.tg_id})
@@ -50,17 +53,17 @@ def register_api_user(user_data: APILogin, db: Session = Depends(get_db)):
 @router.post("/login", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # 1. Находим пользователя по имени
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = (await db.execute(select(User).where(User.username == form_data.username))).scalars().first()
     
     # Проверка: пользователь должен существовать И иметь хеш пароля
     if not user or not user.hashed_password:
         raise HTTPException(status_code=400, detail="Неверное имя пользователя или пароль.")
 
     # 2. Проверяем пароль
-    if not verify_password(form_data.password, user.hashed_password):
+    if not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Неверное имя пользователя или пароль.")
     
     # 3. Генерируем токен
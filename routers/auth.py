@@ -6,10 +6,10 @@ from passlib.context import CryptContext
 from jose import jwt
 from fastapi import APIRouter, Depends, HTTPException, status # <-- ДОБАВЛЕНО
 from pydantic import BaseModel # <-- ДОБАВЛЕНО
-from sqlalchemy.orm import Session # <-- ДОБАВЛЕНО
+from sqlalchemy.ext.asyncio import AsyncSession # <-- ДОБАВЛЕНО
 
 # Предполагаем, что get_db и User/UserModel находятся в этих модулях:
-from database import get_db 
+from database import get_async_db 
 # from models import User # Модель User закомментирована, чтобы избежать ошибок импорта, если ее нет
 
 # ========================================
@@ -72,7 +72,7 @@ router = APIRouter()
 # ========================================
 
 @router.post("/register", response_model=Token, summary="Регистрация нового пользователя")
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     ВАЖНО: Добавьте здесь реальную логику БД:
     1. Проверить, что пользователь с таким именем не существует.
@@ -93,7 +93,7 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token, summary="Вход по логину/паролю")
-def login_for_access_token(user_data: UserCreate, db: Session = Depends(get_db)):
+async def login_for_access_token(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     ВАЖНО: Добавьте здесь реальную логику БД:
     1. Найти пользователя по username.
@@ -0,0 +1,28 @@
+# routers/internal.py
+# Служебные эндпоинты для мониторинга. Доступны только при заданном INTERNAL_METRICS_TOKEN
+# и только с этим токеном в заголовке X-Internal-Token; иначе - 404.
+import os
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+
+from utils import executors
+from utils.db_metrics import pool_metrics
+
+INTERNAL_METRICS_TOKEN = os.getenv("INTERNAL_METRICS_TOKEN")
+
+router = APIRouter(tags=["Internal"])
+
+
+def check_token(token: Optional[str]):
+    # Без настроенного токена эндпоинт закрыт; не раскрываем, что он существует
+    if not INTERNAL_METRICS_TOKEN or not hmac.compare_digest(token or "", INTERNAL_METRICS_TOKEN):
+        raise HTTPException(status_code=404)
+
+
+@router.get("/metrics")
+def get_metrics(x_internal_token: Optional[str] = Header(None)):
+    """Пулы соединений БД (занятость, ожидание, инвалидации) и пулы исполнителей"""
+    check_token(x_internal_token)
+    return {"db_pools": pool_metrics(), "executors": executors.pools_info()}
@@ -1,10 +1,12 @@
 # stylist-backend/routers/looks.py (Исправленное)
 
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from database import get_async_db
 # ИСПРАВЛЕНИЕ: Изменяем относительные импорты на абсолютные
-from models import User, Look 
+from models import User, Look, LookItem, WardrobeItem, parse_items_ids
 from utils.auth import get_current_user_id 
 from datetime import datetime
 
@@ -12,53 +14,78 @@ router = APIRouter()
 
 # Сохранить лук
 @router.post("/save")
-def save_look(
+async def save_look(
     look_name: str,
     items_ids: str,
     occasion: str = None,
     image_url: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id) # <-- ЗАЩИТА
 ):
     # Убираем лишний поиск user, т.к. user_id теперь tg_id
     # Но для 404 проверки оставим
-    user = db.query(User).filter(User.tg_id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(404, "User not found")
 
+    # В лук попадают только вещи из гардероба этого пользователя, в переданном порядке
+    requested_ids = parse_items_ids(items_ids)
+    owned_ids = set((await db.execute(
+        select(WardrobeItem.id).where(WardrobeItem.user_id == user.tg_id, WardrobeItem.id.in_(requested_ids))
+    )).scalars().all()) if requested_ids else set()
+    item_ids = [item_id for item_id in requested_ids if item_id in owned_ids]
+    if not item_ids:
+        raise HTTPException(400, "Нет вещей гардероба для лука")
+
     new_look = Look(
         user_id=user.tg_id, # используем безопасный user_id
         look_name=look_name,
-        # ...
+        items_ids=",".join(map(str, item_ids)),
+        occasion=occasion,
+        image_url=image_url,
+        created_at=datetime.utcnow(),
+        look_items=[LookItem(item_id=item_id, position=i) for i, item_id in enumerate(item_ids)]
     )
-    # ...
+    db.add(new_look)
+    await db.commit()
+    return {"status": "success", "look_id": new_look.id}
 
 # Получить все луки пользователя
 @router.get("/") # Изменяем на /
-def get_looks(
-    db: Session = Depends(get_db),
+async def get_looks(
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id) # <-- ЗАЩИТА
 ):
-    user = db.query(User).filter(User.tg_id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(404, "User not found")
 
-    looks = db.query(Look).filter(Look.user_id == user.tg_id).order_by(Look.id.desc()).all()
+    # Вещи всех луков подгружаются одним дополнительным запросом (selectinload), а не по запросу на лук
+    looks = (await db.execute(
+        select(Look).where(Look.user_id == user.tg_id).order_by(Look.id.desc())
+        .options(selectinload(Look.items))
+    )).scalars().all()
     return {"looks": looks}
 
 # Удалить лук
 @router.delete("/{look_id}")
-def delete_look(
+async def delete_look(
     look_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id) # <-- ЗАЩИТА
 ):
-    user = db.query(User).filter(User.tg_id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(404, "User not found")
         
-    look = db.query(Look).filter(
-        Look.id == look_id,
-        Look.user_id == user.tg_id
-    ).first()
-    # ...
+    look = (await db.execute(
+        select(Look).where(Look.id == look_id, Look.user_id == user.tg_id)
+        .options(selectinload(Look.look_items))
+    )).scalars().first()
+    if not look:
+        raise HTTPException(404, "Look not found")
+
+    # Строки look_items удаляются каскадом
+    await db.delete(look)
+    await db.commit()
+    return {"status": "success"}
@@ -1,11 +1,12 @@
 # routers/profile.py
 
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import List, Optional
 
-from database import get_db
+from database import get_async_db
 # ИСПРАВЛЕНИЕ 1: Изменяем относительные импорты на абсолютные
 from models import User, WardrobeItem, Look, Analysis 
 from utils.auth import get_current_user_id 
@@ -17,18 +18,18 @@ router = APIRouter(tags=["Profile"])
 # Роут /: Получить профиль пользователя + последние 5 анализов
 # ------------------------------------------------------------------------------------
 @router.get("/")
-def get_profile(
-    db: Session = Depends(get_db),
+async def get_profile(
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id) # <-- ЗАЩИТА
 ):
-    user = db.query(User).filter(User.tg_id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Получаем последние 5 анализов
-    latest_analyses = db.query(Analysis).filter(
-        Analysis.user_id == user_id
-    ).order_by(Analysis.id.desc()).limit(5).all()
+    latest_analyses = (await db.execute(
+        select(Analysis).where(Analysis.user_id == user_id).order_by(Analysis.id.desc()).limit(5)
+    )).scalars().all()
 
     return {
         "user": {
@@ -47,19 +48,19 @@ def get_profile(
 # Роут /analyses: Получить все анализы
 # ------------------------------------------------------------------------------------
 @router.get("/analyses") 
-def get_analyses(
+async def get_analyses(
     limit: int = 20, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id) # <-- ЗАЩИТА
 ):
     # Проверяем существование пользователя (хотя get_current_user_id уже должен это делать)
-    user = db.query(User).filter(User.tg_id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
-    analyses = db.query(Analysis).filter(
-        Analysis.user_id == user_id
-    ).order_by(Analysis.id.desc()).limit(limit).all()
+    analyses = (await db.execute(
+        select(Analysis).where(Analysis.user_id == user_id).order_by(Analysis.id.desc()).limit(limit)
+    )).scalars().all()
     
     return {"analyses": analyses}
 
@@ -68,14 +69,14 @@ def get_analyses(
 # Роут /analysis/save: Сохранить анализ
 # ------------------------------------------------------------------------------------
 @router.post("/analysis/save")
-def save_analysis(
+async def save_analysis(
     photo_id: str,
     analysis_text: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id) # <-- ЗАЩИТА
 ):
     # Проверяем существование пользователя 
-    user = db.query(User).filter(User.tg_id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
@@ -88,7 +89,7 @@ def save_analysis(
     )
     
     db.add(new_analysis)
-    db.commit()
-    db.refresh(new_analysis)
+    await db.commit()
+    await db.refresh(new_analysis)
     
     return {"status": "success", "analysis_id": new_analysis.id}
@@ -8,8 +8,8 @@ import urllib.parse
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from .auth import create_access_token 
 from models import User  # Импорт модели
 
@@ -86,9 +86,9 @@ def validate_telegram_data(init_data: str) -> dict:
     return user_data
 
 @router.post("/tg-login", response_model=Token)
-def telegram_login(
+async def telegram_login(
     payload: TelegramAuthPayload, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     user_data = validate_telegram_data(payload.init_data) 
     
@@ -100,7 +100,7 @@ def telegram_login(
         )
     
     # 🔥 ИСПОЛЬЗУЕМ tg_id ВМЕСТО id
-    user = db.query(User).filter(User.tg_id == user_id).first()
+    user = await db.get(User, user_id)
     
     if not user:
         # Создаём нового пользователя
@@ -112,13 +112,13 @@ def telegram_login(
             last_login=datetime.utcnow(),
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         print(f"✅ New user created: {user_id}")
     else:
         # Обновляем last_login
         user.last_login = datetime.utcnow()
-        db.commit()
+        await db.commit()
     
     access_token = create_access_token(data={"user_id": user_id})
     
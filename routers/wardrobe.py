@@ -1,20 +1,21 @@
-import os, uuid, asyncio, re, logging, json
+import os, uuid, asyncio, re, logging, json, time
 from datetime import datetime
-from io import BytesIO
-from PIL import Image, ImageFilter, ImageStat
-from concurrent.futures import ThreadPoolExecutor
 from curl_cffi import requests as crequests
+from curl_cffi.requests import AsyncSession
 
 try:
     from bs4 import BeautifulSoup
 except ImportError:
     pass
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import get_db
-from models import WardrobeItem
-from utils.storage import delete_image, save_image
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession as DbSession  # AsyncSession - это curl_cffi
+from database import get_async_db
+from models import User, WardrobeItem
+from utils.storage import STORAGE
+from utils import wb_baskets, product_cache, executors, session_store
+from utils.image_processor import analyze_candidate, make_derivatives
 from .dependencies import get_current_user_id
 from pydantic import BaseModel
 from typing import Optional
@@ -24,10 +25,31 @@ logger = logging.getLogger(__name__)
 # CLIP Integration
 CLIP_AVAILABLE = False
 try:
-    from utils.clip_client import rate_image_relevance
+    from utils.clip_client import rate_images_relevance, NEUTRAL_SCORE
     CLIP_AVAILABLE = True
 except ImportError:
-    def rate_image_relevance(img, name): return 50.0
+    NEUTRAL_SCORE = 50.0
+    async def rate_images_relevance(images, name, deadline=None): return [NEUTRAL_SCORE] * len(images)
+
+# Общий бюджет времени на импорт товара; скоринг получает то, что осталось
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "30"))
+
+# Кандидаты оцениваются по уменьшенной копии WB (images/<tier>/N.webp),
+# полный размер (images/big) - только для лучшего варианта (в фоне) и выбранного
+WB_PREVIEW_TIER = os.getenv("WB_PREVIEW_TIER", "c516x688")
+PREVIEW_SIZE = 336
+# Порог плотности границ на превью ~336px, выше - таблица размеров/коллаж
+EDGE_DENSITY_LIMIT = float(os.getenv("EDGE_DENSITY_LIMIT", "45"))
+
+# Потоковая оценка кандидатов: волнами в порядке фото WB, пока не наберётся
+# IMPORT_TARGET_VARIANTS хороших вариантов со score не ниже IMPORT_CONFIDENT_SCORE
+IMPORT_TARGET_VARIANTS = int(os.getenv("IMPORT_TARGET_VARIANTS", "6"))
+IMPORT_CONFIDENT_SCORE = float(os.getenv("IMPORT_CONFIDENT_SCORE", "25"))
+IMPORT_WAVE_SIZE = int(os.getenv("IMPORT_WAVE_SIZE", "3"))
+
+# Размер страницы /items
+ITEMS_PAGE_DEFAULT = int(os.getenv("ITEMS_PAGE_DEFAULT", "100"))
+ITEMS_PAGE_MAX = int(os.getenv("ITEMS_PAGE_MAX", "200"))
 
 router = APIRouter(tags=["Wardrobe"])
 
@@ -40,52 +62,56 @@ class SelectVariantPayload(BaseModel):
     selected_variant: str
     name: str
 
-VARIANTS_STORAGE = {}
+# Параметры параллельной пробы корзин
+WB_PROBE_TIMEOUT = float(os.getenv("WB_PROBE_TIMEOUT", "2"))
+WB_PROBE_STAGGER = float(os.getenv("WB_PROBE_STAGGER", "0.05"))
+WB_MAX_BASKET = int(os.getenv("WB_MAX_BASKET", "30"))
 
 def get_wb_basket_v2(nm_id: int) -> str:
-    vol = nm_id // 100000
-    if vol <= 143: return "01"
-    if vol <= 287: return "02"
-    if vol <= 431: return "03"
-    if vol <= 719: return "04"
-    if vol <= 1007: return "05"
-    if vol <= 1061: return "06"
-    if vol <= 1115: return "07"
-    if vol <= 1169: return "08"
-    if vol <= 1313: return "09"
-    if vol <= 1601: return "10"
-    if vol <= 1655: return "11"
-    if vol <= 1919: return "12"
-    if vol <= 2045: return "13"
-    if vol <= 2189: return "14"
-    if vol <= 2405: return "15"
-    if vol <= 2621: return "16"
-    if vol <= 2837: return "17"
-    if vol <= 3053: return "18"
-    if vol <= 3269: return "19"
-    if vol <= 3485: return "20"
-    if vol <= 3701: return "21"
-    if vol <= 3917: return "22"
-    if vol <= 4133: return "23"
-    if vol <= 4349: return "24"
-    if vol <= 4565: return "25"
-    if vol <= 4781: return "26"
-    if vol <= 4997: return "27"
-    if vol <= 5213: return "28"
-    if vol <= 5429: return "29"
-    return "30"
+    return wb_baskets.basket_for_vol(nm_id // 100000)
+
+async def race_first(coros):
+    """Запускает корутины параллельно и возвращает первый не-None результат, остальные отменяет"""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                result = await fut
+            except Exception:
+                continue
+            if result is not None:
+                return result
+        return None
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 async def find_working_basket(nm_id: int):
     vol, part = nm_id // 100000, nm_id // 1000
     initial_basket = get_wb_basket_v2(nm_id)
-    baskets_to_try = [initial_basket] + [f"{i:02d}" for i in range(1, 31) if f"{i:02d}" != initial_basket]
-    
-    for b in baskets_to_try:
-        test_url = f"https://basket-{b}.wbbasket.ru/vol{vol}/part{part}/{nm_id}/images/big/1.webp"
-        try:
-            r = crequests.head(test_url, impersonate="chrome120", timeout=2)
-            if r.status_code == 200: return b
-        except: continue
+    if wb_baskets.is_confirmed(vol):
+        return initial_basket
+    
+    # Сначала лучшая догадка, затем соседние корзины по удалённости от неё
+    guess = int(initial_basket)
+    max_basket = max(WB_MAX_BASKET, wb_baskets.max_known_basket() + 2)
+    baskets_to_try = sorted(range(1, max_basket + 1), key=lambda b: (abs(b - guess), b))
+    
+    async def probe(session, order, b):
+        # Небольшой сдвиг старта: если догадка верна, остальные пробы не успеют уйти в сеть
+        await asyncio.sleep(order * WB_PROBE_STAGGER)
+        basket = f"{b:02d}"
+        test_url = f"https://basket-{basket}.wbbasket.ru/vol{vol}/part{part}/{nm_id}/images/big/1.webp"
+        r = await session.head(test_url, timeout=WB_PROBE_TIMEOUT)
+        return basket if r.status_code == 200 else None
+    
+    async with AsyncSession(impersonate="chrome120") as session:
+        found = await race_first(probe(session, order, b) for order, b in enumerate(baskets_to_try))
+    
+    if found:
+        wb_baskets.record(vol, found)
+        return found
     return initial_basket
 
 def clean_wb_title(title: str) -> str:
@@ -106,78 +132,228 @@ def clean_wb_title(title: str) -> str:
     # Возвращаем капитализированную строку (например, "Брюки Палаццо")
     return " ".join(words).strip().capitalize()
 
-async def parse_wildberries_v3(url: str):
-    match = re.search(r'catalog/(\d+)', url)
-    if not match: return [], "Новый товар"
-    nm_id = int(match.group(1))
-    
-    title = ""
-    # Список регионов для обхода блокировок API
-    dests = ["-1257786", "-1255800", "-121393"]
-    
+# Список регионов для обхода блокировок API
+WB_CARD_DESTS = ["-1257786", "-1255800", "-121393"]
+WB_CARD_TIMEOUT = float(os.getenv("WB_CARD_TIMEOUT", "5"))
+
+async def fetch_wb_title(nm_id: int) -> str:
+    """Опрашивает card API по всем регионам параллельно; побеждает первый валидный ответ"""
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
         "Accept": "*/*",
         "Referer": f"https://www.wildberries.ru/catalog/{nm_id}/detail.aspx"
     }
+    
+    async def fetch(session, dest):
+        api_url = f"https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest={dest}&nm={nm_id}"
+        r = await session.get(api_url, headers=headers, timeout=WB_CARD_TIMEOUT)
+        if r.status_code != 200:
+            return None
+        p_list = r.json().get('data', {}).get('products', [])
+        if not p_list:
+            return None
+        p = p_list[0]
+        brand = p.get('brand', '')
+        name = p.get('name', '')
+        return f"{brand} {name}".strip() or None
+    
+    async with AsyncSession(impersonate="chrome120") as session:
+        return await race_first(fetch(session, d) for d in WB_CARD_DESTS) or ""
 
-    # Пытаемся получить имя через несколько API
-    for d in dests:
-        try:
-            api_url = f"https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest={d}&nm={nm_id}"
-            r = crequests.get(api_url, impersonate="chrome120", headers=headers, timeout=5)
-            if r.status_code == 200:
-                p_list = r.json().get('data', {}).get('products', [])
-                if p_list:
-                    p = p_list[0]
-                    brand = p.get('brand', '')
-                    name = p.get('name', '')
-                    title = f"{brand} {name}".strip()
-                    if title: break
-        except: continue
+def extract_wb_nm_id(url: str) -> Optional[int]:
+    match = re.search(r'catalog/(\d+)', url)
+    return int(match.group(1)) if match else None
+
+async def resolve_wb_product(nm_id: int):
+    """Возвращает (URL кандидатов, название, корзина) для товара WB"""
+    # Название и поиск корзины друг от друга не зависят - идут параллельно
+    title, basket = await asyncio.gather(fetch_wb_title(nm_id), find_working_basket(nm_id))
 
     # Очищаем полученное название
     final_title = clean_wb_title(title) or "Товар Wildberries"
     logger.info(f"🔎 Распознано название: {final_title}")
 
     # Поиск картинок
-    basket = await find_working_basket(nm_id)
     vol, part = nm_id // 100000, nm_id // 1000
     host = f"basket-{basket}.wbbasket.ru"
     image_urls = [f"https://{host}/vol{vol}/part{part}/{nm_id}/images/big/{i}.webp" for i in range(1, 10)]
     
+    return image_urls, final_title, basket
+
+async def parse_wildberries_v3(url: str):
+    nm_id = extract_wb_nm_id(url)
+    if not nm_id: return [], "Новый товар"
+    image_urls, final_title, _ = await resolve_wb_product(nm_id)
     return image_urls, final_title
 
-def process_single_image(idx, url, item_category):
+def download_candidate(url):
+    """Скачивает картинку синхронно (выполняется в IO-пуле; для выбранного варианта в select_variant)"""
+    resp = crequests.get(url, impersonate="chrome120", timeout=10)
+    if resp.status_code != 200: return None
+    return resp.content
+
+async def fetch_candidate(session, url):
+    """
+    Скачивает картинку кандидата через AsyncSession: отмена задачи прерывает
+    саму передачу, а не только ожидание результата (в отличие от загрузки в IO-пуле)
+    """
+    resp = await session.get(url, timeout=10)
+    if resp.status_code != 200: return None
+    return resp.content
+
+def wb_preview_url(url):
+    """URL уменьшенной копии картинки WB того же кандидата"""
+    if not WB_PREVIEW_TIER or WB_PREVIEW_TIER == "big":
+        return url
+    return url.replace("/images/big/", f"/images/{WB_PREVIEW_TIER}/")
+
+async def process_single_image(idx, url, session, stats=None):
+    """Скачивает кандидата и готовит превью; скоринг делается потом одним батчем"""
     try:
-        resp = crequests.get(url, impersonate="chrome120", timeout=10)
-        if resp.status_code != 200: return None
-        img = Image.open(BytesIO(resp.content)).convert("RGB")
-        edge_density = ImageStat.Stat(img.convert("L").filter(ImageFilter.FIND_EDGES)).mean[0]
-        preview = img.copy()
-        preview.thumbnail((336, 336))
+        if stats is not None:
+            stats["started"] += 1
+        preview_url = wb_preview_url(url)
+        content = await fetch_candidate(session, preview_url)
+        if content is None and preview_url != url:
+            # Уменьшенной копии нет - берём оригинал
+            content = await fetch_candidate(session, url)
+            original = content
+        else:
+            original = content if preview_url == url else None
+        if content is None: return None
+        analysis = await executors.CPU_POOL.run(analyze_candidate, content, PREVIEW_SIZE)
+        return {"key": f"v_{idx}", "url": url, "data": analysis["preview"], "edge_density": analysis["edge_density"],
+                "original": original}
+    except Exception as e:
+        logger.warning(f"⚠️ Кандидат {url} пропущен: {e}")
+        return None
+
+async def score_candidates(results, item_category, deadline=None):
+    """Оценивает все превью одним запросом к CLIP и помечает мусорные"""
+    # Если категория пустая, ищем просто одежду
+    tag = item_category if len(item_category) > 3 else "fashion item"
+    scores = await rate_images_relevance([r["data"] for r in results], tag, deadline)
+    
+    for r, score in zip(results, scores):
+        r["score"] = score
+        r["is_bad"] = (r["edge_density"] > EDGE_DENSITY_LIMIT or score < 12.0)
+    return results
+
+def is_confident(result):
+    return not result["is_bad"] and result["score"] >= IMPORT_CONFIDENT_SCORE
+
+async def evaluate_candidates_streaming(image_urls, item_category, deadline=None):
+    """
+    Оценивает кандидатов волнами по IMPORT_WAVE_SIZE в порядке приоритета (первые фото WB обычно лучшие).
+    Следующая волна качается заранее, пока оценивается текущая, - но только если цель
+    не набрать даже при всех уверенных вариантах текущей. Как только набралось
+    IMPORT_TARGET_VARIANTS уверенных вариантов, оставшиеся загрузки отменяются.
+    Возвращает (результаты, статистика импорта).
+    """
+    candidates = list(enumerate(image_urls))
+    wave_size = max(1, IMPORT_WAVE_SIZE)
+    waves = [candidates[i:i + wave_size] for i in range(0, len(candidates), wave_size)]
+    stats = {"candidates": len(candidates), "launched": 0, "started": 0, "downloaded": 0,
+             "cancelled": 0, "saved_fetches": 0, "waves": 0, "early_exit": False}
+    
+    results = []
+    async with AsyncSession(impersonate="chrome120", max_clients=max(2, 2 * wave_size)) as session:
+        def launch(wave):
+            stats["launched"] += len(wave)
+            return [asyncio.ensure_future(process_single_image(i, url, session, stats)) for i, url in wave]
         
-        # Если категория пустая, ищем просто одежду
-        tag = item_category if len(item_category) > 3 else "fashion item"
-        score = rate_image_relevance(preview, tag)
+        pending = []
+        for w, wave in enumerate(waves):
+            current = pending or launch(wave)
+            confident = sum(1 for r in results if is_confident(r))
+            # Предзагрузка следующей волны нужна, только если текущей заведомо не хватит до цели
+            needs_next = confident + len(wave) < IMPORT_TARGET_VARIANTS
+            pending = launch(waves[w + 1]) if w + 1 < len(waves) and needs_next else []
+            
+            wave_results = [r for r in await asyncio.gather(*current) if r]
+            stats["waves"] += 1
+            stats["downloaded"] += len(wave_results)
+            if wave_results:
+                results.extend(await score_candidates(wave_results, item_category, deadline))
+            
+            if sum(1 for r in results if is_confident(r)) >= IMPORT_TARGET_VARIANTS:
+                stats["early_exit"] = True
+                break
         
-        is_bad = (edge_density > 45 or score < 12.0)
-        out = BytesIO()
-        preview.save(out, format="JPEG", quality=85)
-        return {"key": f"v_{idx}", "url": url, "data": out.getvalue(), "score": score, "is_bad": is_bad}
-    except: return None
+        # Отменяем то, что уже не нужно: отмена прерывает и начатые передачи curl
+        for task in pending:
+            if not task.done() and task.cancel():
+                stats["cancelled"] += 1
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    # Сэкономлены только загрузки, которые так и не начались
+    stats["saved_fetches"] = stats["candidates"] - stats["started"]
+    return results, stats
 
-@router.post("/add-marketplace-with-variants")
-async def add_marketplace_with_variants(payload: ItemUrlPayload, user_id: int = Depends(get_current_user_id)):
-    image_urls, full_title = await parse_wildberries_v3(payload.url)
+async def collect_wb_candidates(nm_id, deadline):
+    """Полный путь без кэша: card API + корзина, скачивание кандидатов и скоринг CLIP"""
+    if not nm_id:
+        return "Новый товар", [], {}
+    image_urls, full_title, basket = await resolve_wb_product(nm_id)
     
     # Категория для нейронки (короткая)
     ml_category = " ".join(full_title.split()[:2])
     
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        tasks = [loop.run_in_executor(executor, process_single_image, i, url, ml_category) for i, url in enumerate(image_urls)]
-        all_results = [r for r in await asyncio.gather(*tasks) if r]
+    all_results, stats = await evaluate_candidates_streaming(image_urls, ml_category, deadline)
+    logger.info(f"📊 Импорт {nm_id}: {stats}")
+    
+    if not all_results:
+        return full_title, [], stats
+    
+    # Если CLIP был недоступен (все score нейтральные), в кэш не кладём
+    if any(r["score"] != NEUTRAL_SCORE for r in all_results):
+        # Кэш товара может быть SQLite (запись + pickle превью) - в IO-пуле, как и сессии
+        await executors.IO_POOL.run(product_cache.put_product, nm_id, {
+            "title": full_title,
+            "basket": basket,
+            "candidates": [
+                {k: r[k] for k in ("key", "url", "data", "score", "is_bad")}
+                for r in all_results
+            ]
+        })
+    return full_title, all_results, stats
+
+_BACKGROUND_TASKS = set()
+
+def spawn_background(coro):
+    """Фоновая задача, которую не соберёт GC, пока она не завершится"""
+    task = asyncio.ensure_future(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+async def spill_original(path, url, original=None):
+    """
+    Кладёт оригинал варианта в файл сессии: уже скачанный при импорте или
+    (original=None) докачивает images/big, пока пользователь выбирает.
+    """
+    try:
+        if original is None:
+            original = await executors.IO_POOL.run(download_candidate, url)
+            if original is None:
+                return
+        await executors.IO_POOL.run(session_store.write_spill, path, original)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить оригинал {url}: {e}")
+
+@router.post("/add-marketplace-with-variants")
+async def add_marketplace_with_variants(payload: ItemUrlPayload, user_id: int = Depends(get_current_user_id)):
+    deadline = time.monotonic() + IMPORT_BUDGET_SECONDS
+    nm_id = extract_wb_nm_id(payload.url)
+    
+    # Тот же товар уже импортировали недавно - берём готовых кандидатов из кэша
+    cached = await executors.IO_POOL.run(product_cache.get_product, nm_id) if nm_id else None
+    if cached:
+        logger.info(f"⚡ Товар {nm_id} найден в кэше")
+        full_title, all_results = cached["title"], [dict(c) for c in cached["candidates"]]
+        import_stats = {"cache_hit": True, "saved_fetches": len(all_results)}
+    else:
+        full_title, all_results, import_stats = await collect_wb_candidates(nm_id, deadline)
 
     if not all_results:
         raise HTTPException(400, "Не удалось получить данные о товаре")
@@ -189,38 +365,139 @@ async def add_marketplace_with_variants(payload: ItemUrlPayload, user_id: int =
     temp_id = uuid.uuid4().hex
     previews, full_urls = {}, {}
 
-    for item in final_selection[:6]:
-        v_key = item["key"]
-        saved_url = save_image(f"t_{temp_id}_{v_key}.jpg", item["data"])
-        previews[v_key] = saved_url
-        full_urls[v_key] = item["url"]
+    survivors = final_selection[:6]
+    saved_urls = await asyncio.gather(*[
+        STORAGE.save(f"t_{temp_id}_{item['key']}.jpg", item["data"]) for item in survivors
+    ])
+    for item, saved_url in zip(survivors, saved_urls):
+        previews[item["key"]] = saved_url
+        full_urls[item["key"]] = item["url"]
 
-    VARIANTS_STORAGE[temp_id] = {"urls": full_urls, "previews": previews, "user_id": user_id}
+    # Файлы сессии: варианты, чей оригинал уже скачан, и лучший по score - его выбирают чаще всего,
+    # и его images/big докачивается в фоне. При попадании в кэш товара в WB не ходим вовсе
+    prefetch_key = survivors[0]["key"] if survivors and not import_stats.get("cache_hit") else None
+    spill = {
+        item["key"]: session_store.spill_path(temp_id, item["key"])
+        for item in survivors if item.get("original") is not None or item["key"] == prefetch_key
+    }
+    # Хранилище сессий блокирующее (SQLite, а при попутной чистке - удаление превью), поэтому в IO-пуле
+    await executors.IO_POOL.run(
+        session_store.save_session, temp_id, {"urls": full_urls, "previews": previews, "spill": spill, "user_id": user_id}
+    )
+    
+    # Оригиналы сохраняются на диск в фоне, пока пользователь выбирает
+    for item in survivors:
+        if item["key"] in spill:
+            spawn_background(spill_original(spill[item["key"]], item["url"], item.get("original")))
     
     return {
         "temp_id": temp_id, 
         "suggested_name": full_title, 
-        "variants": previews
+        "variants": previews,
+        "stats": import_stats
     }
 
+async def save_with_derivatives(content: bytes):
+    """
+    Сохраняет оригинал и его уменьшенные копии (WebP + JPEG на каждый размер DERIVATIVE_SIZES).
+    Возвращает (url оригинала, словарь для WardrobeItem.image_variants или None).
+    """
+    filename = f"item_{uuid.uuid4().hex}.jpg"
+    derivatives_task = asyncio.create_task(executors.CPU_POOL.run(make_derivatives, content))
+    try:
+        original_url = await STORAGE.save(filename, content)
+    except BaseException:
+        derivatives_task.cancel()
+        raise
+    try:
+        derivatives = await derivatives_task
+    except Exception as e:
+        # Без копий вещь всё равно сохраняется - клиент возьмёт image_url
+        logger.warning(f"⚠️ Не удалось подготовить уменьшенные копии: {e}")
+        return original_url, None
+    
+    # Копии кладутся под именем сохранённого оригинала: <stem>_grid.webp, <stem>_grid.jpg, ...
+    # По этим именам их находит и ImmutableStaticFiles (?size=grid, Accept: image/webp)
+    stem = os.path.splitext(STORAGE.stored_name(original_url) or filename)[0]
+    names = [(name, fmt) for name in derivatives for fmt in ("webp", "jpeg")]
+    urls = await asyncio.gather(*[
+        STORAGE.save(filename, derivatives[name][fmt], name=f"{stem}_{name}.{'webp' if fmt == 'webp' else 'jpg'}")
+        for name, fmt in names
+    ])
+    variants = {}
+    for (name, fmt), url in zip(names, urls):
+        width, height = derivatives[name]["size"]
+        variants.setdefault(name, {"width": width, "height": height})[fmt] = url
+    return original_url, variants
+
 @router.post("/select-variant")
-async def select_variant(payload: SelectVariantPayload, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    data = VARIANTS_STORAGE.get(payload.temp_id)
+async def select_variant(payload: SelectVariantPayload, db: DbSession = Depends(get_async_db), user_id: int = Depends(get_current_user_id)):
+    data = await executors.IO_POOL.run(session_store.get_session, payload.temp_id)
     if not data or data["user_id"] != user_id: raise HTTPException(404, "Session expired")
     
-    r = crequests.get(data["urls"].get(payload.selected_variant), impersonate="chrome120")
-    final_url = save_image(f"item_{uuid.uuid4().hex}.jpg", r.content)
+    source_url = data["urls"].get(payload.selected_variant)
+    if not source_url: raise HTTPException(400, "Unknown variant")
     
-    # Удаляем временные превью
-    for p_url in data["previews"].values():
-        try: delete_image(p_url)
-        except: pass
-    del VARIANTS_STORAGE[payload.temp_id]
+    # Оригинал уже лежит в файле сессии; в сеть идём, только если фоновая загрузка не успела
+    spill = data.get("spill", {}).get(payload.selected_variant)
+    content = await executors.IO_POOL.run(session_store.read_spill, spill) if spill else None
+    if content is None:
+        content = await executors.IO_POOL.run(download_candidate, source_url)
+    if content is None: raise HTTPException(502, "Не удалось загрузить изображение")
+    
+    final_url, image_variants = await save_with_derivatives(content)
+    
+    # Закрываем сессию и удаляем временные превью
+    await executors.IO_POOL.run(session_store.pop_session, payload.temp_id)
+    await executors.IO_POOL.run(session_store.cleanup_session, payload.temp_id, data)
 
-    item = WardrobeItem(user_id=user_id, name=payload.name, image_url=final_url, item_type="marketplace", created_at=datetime.utcnow())
-    db.add(item); db.commit(); db.refresh(item)
+    item = WardrobeItem(user_id=user_id, name=payload.name, image_url=final_url, image_variants=image_variants, item_type="marketplace", created_at=datetime.utcnow())
+    db.add(item); await bump_wardrobe_version(db, user_id); await db.commit(); await db.refresh(item)
     return item
 
+async def bump_wardrobe_version(db: DbSession, user_id: int):
+    """Вызывается в той же транзакции, что и изменение гардероба: старые ETag /items перестают совпадать"""
+    await db.execute(
+        update(User).where(User.tg_id == user_id)
+        .values(wardrobe_version=func.coalesce(User.wardrobe_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
 @router.get("/items")
-def get_items(user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
-    return db.query(WardrobeItem).filter(WardrobeItem.user_id == user_id).order_by(WardrobeItem.id.desc()).all()
+async def get_items(
+    request: Request,
+    response: Response,
+    before_id: Optional[int] = Query(None, description="Курсор: вернуть вещи с id меньше этого (из X-Next-Cursor)"),
+    limit: int = Query(ITEMS_PAGE_DEFAULT, ge=1, le=ITEMS_PAGE_MAX),
+    user_id: int = Depends(get_current_user_id),
+    db: DbSession = Depends(get_async_db)
+):
+    """
+    Страница гардероба, новые сверху (keyset по (user_id, id DESC)).
+    Если есть следующая страница, её курсор приходит в заголовке X-Next-Cursor.
+    ETag строится из версии гардероба: при совпадении If-None-Match - 304 без выборки вещей.
+    """
+    version = (await db.execute(select(User.wardrobe_version).where(User.tg_id == user_id))).scalar() or 0
+    etag = f'"w{user_id}-v{version}-{before_id or 0}-{limit}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    
+    query = select(WardrobeItem).where(WardrobeItem.user_id == user_id)
+    if before_id is not None:
+        query = query.where(WardrobeItem.id < before_id)
+    # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+    items = (await db.execute(query.order_by(WardrobeItem.id.desc()).limit(limit + 1))).scalars().all()
+    if len(items) > limit:
+        items = items[:limit]
+        headers["X-Next-Cursor"] = str(items[-1].id)
+    
+    response.headers.update(headers)
+    return items
@@ -0,0 +1,127 @@
+# clip_benchmark.py
+# Сравнение режимов инференса CLIP на фиксированном наборе картинок:
+#   python clip_benchmark.py --images ./bench_images --modes fp32,int8
+# Для каждого режима печатает латентность (batch=1), пропускную способность
+# (батчами) и совпадение top-1 по всем головам с первым (эталонным) режимом.
+
+import argparse
+import os
+import statistics
+import time
+
+import torch
+from PIL import Image
+
+import clip
+from clip_service import ATTRIBUTE_HEADS, INFERENCE_MODES, build_model, build_prompts
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_images(folder: str) -> list:
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(IMAGE_EXTENSIONS))
+    if not names:
+        raise SystemExit(f"В папке {folder} нет картинок")
+    return [(n, Image.open(os.path.join(folder, n)).convert("RGB")) for n in names]
+
+
+def encode_heads_text(model, device: str) -> tuple:
+    """Склеенная матрица текстовых эмбеддингов всех голов + границы голов"""
+    prompts, spans = [], {}
+    for name, categories in ATTRIBUTE_HEADS.items():
+        spans[name] = (len(prompts), len(prompts) + len(categories))
+        prompts.extend(build_prompts(categories, "ru"))
+    with torch.no_grad():
+        text_features = model.encode_text(clip.tokenize(prompts).to(device))
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+    return text_features, spans
+
+
+def encode_batch(model, batch: torch.Tensor) -> torch.Tensor:
+    with torch.no_grad():
+        features = model.encode_image(batch)
+        features /= features.norm(dim=-1, keepdim=True)
+    return features
+
+
+def run_mode(mode: str, images: list, batch_size: int, warmup: int) -> dict:
+    device = "cpu"
+    load_started = time.perf_counter()
+    model, preprocess = build_model(mode, device)
+    load_seconds = time.perf_counter() - load_started
+
+    tensors = [preprocess(img) for _, img in images]
+    text_features, spans = encode_heads_text(model, device)
+
+    for t in tensors[:warmup]:
+        encode_batch(model, t.unsqueeze(0).to(device))
+
+    # Латентность: одна картинка за вызов
+    latencies = []
+    for t in tensors:
+        started = time.perf_counter()
+        encode_batch(model, t.unsqueeze(0).to(device))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    # Пропускная способность: батчами
+    features = []
+    started = time.perf_counter()
+    for i in range(0, len(tensors), batch_size):
+        features.append(encode_batch(model, torch.stack(tensors[i:i + batch_size]).to(device)))
+    batched_seconds = time.perf_counter() - started
+    image_features = torch.cat(features)
+
+    logits = 100.0 * image_features.float() @ text_features.float().T
+    top1 = {name: logits[:, start:end].argmax(dim=-1).tolist() for name, (start, end) in spans.items()}
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "load_s": load_seconds,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "throughput": len(tensors) / batched_seconds,
+        "top1": top1,
+    }
+
+
+def agreement(reference: dict, other: dict) -> dict:
+    result = {}
+    for name, ref in reference["top1"].items():
+        same = sum(1 for a, b in zip(ref, other["top1"][name]) if a == b)
+        result[name] = same / len(ref)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк режимов инференса CLIP")
+    parser.add_argument("--images", required=True, help="Папка с картинками для замера")
+    parser.add_argument("--modes", default=",".join(INFERENCE_MODES), help="Режимы через запятую, первый - эталон")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 - по умолчанию)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in INFERENCE_MODES]
+    if unknown:
+        raise SystemExit(f"Неизвестные режимы: {unknown}, доступны: {INFERENCE_MODES}")
+
+    images = load_images(args.images)
+    print(f"🖼️ Картинок: {len(images)}, потоков torch: {torch.get_num_threads()}")
+
+    results = [run_mode(m, images, args.batch_size, args.warmup) for m in modes]
+    reference = results[0]
+
+    print(f"\n{'mode':<6} {'load,s':>7} {'p50,ms':>8} {'p95,ms':>8} {'img/s':>8}  top-1 agreement vs {reference['mode']}")
+    for r in results:
+        agree = agreement(reference, r)
+        agree_str = ", ".join(f"{k}={v:.0%}" for k, v in agree.items())
+        print(f"{r['mode']:<6} {r['load_s']:>7.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['throughput']:>8.1f}  {agree_str}")
+
+
+if __name__ == "__main__":
+    main()
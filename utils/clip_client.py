@@ -1,44 +1,263 @@
 # utils/clip_client.py
+import os
+import time
+import asyncio
 import logging
-import requests
 from io import BytesIO
 
+from curl_cffi import CurlMime
+from curl_cffi.requests import AsyncSession
+
 logger = logging.getLogger(__name__)
 
 # Ссылка на ваш контейнер в Яндекс Облаке
-CLIP_URL = "https://bba4bk1mjete8virsbkp.containers.yandexcloud.net"
+CLIP_URL = os.getenv("CLIP_CLOUD_URL", "https://bba4bk1mjete8virsbkp.containers.yandexcloud.net")
+
+# Пул соединений и лимиты
+CLIP_MAX_CONCURRENCY = int(os.getenv("CLIP_MAX_CONCURRENCY", "4"))
+CLIP_TIMEOUT = float(os.getenv("CLIP_TIMEOUT", "20"))
+
+# Circuit breaker: после N ошибок подряд скоринг пропускается на RESET секунд
+CLIP_BREAKER_FAILURES = int(os.getenv("CLIP_BREAKER_FAILURES", "3"))
+CLIP_BREAKER_RESET = float(os.getenv("CLIP_BREAKER_RESET", "30"))
+
+# Нейтральный score, если скоринг недоступен
+NEUTRAL_SCORE = 50.0
+
+
+class ClipUnavailable(Exception):
+    """CLIP пропущен: breaker разомкнут или бюджет времени исчерпан"""
+
+
+def deadline_in(seconds: float) -> float:
+    """Абсолютный дедлайн (time.monotonic) через seconds секунд"""
+    return time.monotonic() + seconds
+
+
+class CircuitBreaker:
+    """
+    closed -> (N ошибок подряд) -> open -> (reset_timeout) -> half_open
+    В half_open пропускается один пробный запрос: успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"🔌 CLIP breaker разомкнут после {self.failures} ошибок подряд")
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Пробный запрос не дошёл до сервиса (например, не хватило бюджета)"""
+        self._probe_in_flight = False
+
+
+class ClipClient:
+    """
+    Асинхронный клиент CLIP-сервиса: одна keep-alive сессия на event loop,
+    ограничение параллельных запросов, дедлайны из бюджета вызывающего и circuit breaker.
+    """
+
+    def __init__(self, base_url: str, max_concurrency: int = CLIP_MAX_CONCURRENCY, timeout: float = CLIP_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(CLIP_BREAKER_FAILURES, CLIP_BREAKER_RESET)
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._loop is not loop:
+            self._session = AsyncSession(max_clients=self.max_concurrency)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            try:
+                await self._session.close()
+            finally:
+                self._session = None
+                self._semaphore = None
+                self._loop = None
+
+    def _remaining(self, deadline) -> float:
+        if deadline is None:
+            return self.timeout
+        return min(self.timeout, deadline - time.monotonic())
+
+    async def _post(self, path: str, deadline: float = None, **kwargs):
+        if not self.breaker.allow():
+            raise ClipUnavailable(f"breaker {self.breaker.state}")
+
+        session = self._ensure_session()
+        try:
+            timeout = self._remaining(deadline)
+            if timeout <= 0:
+                raise ClipUnavailable("бюджет времени исчерпан")
+            # Ожидание свободного слота тоже съедает бюджет
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except (ClipUnavailable, asyncio.TimeoutError) as e:
+            self.breaker.release()
+            raise ClipUnavailable(str(e) or "нет свободного слота в пределах бюджета")
+        except asyncio.CancelledError:
+            # Иначе пробный запрос half_open так и останется "в полёте", и breaker не замкнётся
+            self.breaker.release()
+            raise
 
-def rate_image_relevance(image, product_name: str) -> float:
+        try:
+            timeout = self._remaining(deadline)
+            if timeout <= 0:
+                self.breaker.release()
+                raise ClipUnavailable("бюджет времени исчерпан")
+            response = await session.post(f"{self.base_url}{path}", timeout=timeout, **kwargs)
+        except ClipUnavailable:
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self._semaphore.release()
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def rate_images(self, images: list, product_name: str, deadline: float = None) -> list:
+        """
+        Пакетный скоринг через /rate-batch. Возвращает score в том же порядке;
+        при недоступности сервиса - NEUTRAL_SCORE для всех картинок.
+        """
+        if not images:
+            return []
+        mime = CurlMime()
+        try:
+            for i, img in enumerate(images):
+                mime.addpart(name="files", content_type="image/jpeg", filename=f"image_{i}.jpg", data=_to_jpeg_bytes(img))
+            mime.addpart(name="text", data=product_name.encode("utf-8"))
+
+            response = await self._post("/rate-batch", deadline, multipart=mime)
+
+            if response.status_code == 200:
+                scores = response.json().get("scores") or []
+                if len(scores) == len(images):
+                    return [float(s) for s in scores]
+                logger.warning(f"⚠️ CLIP Cloud вернул {len(scores)} score вместо {len(images)}")
+            elif response.status_code == 404:
+                # Старый контейнер без /rate-batch - оцениваем по одной
+                logger.warning("⚠️ /rate-batch не найден, откат на поштучный /rate")
+                return list(await asyncio.gather(*[self.rate_image(img, product_name, deadline) for img in images]))
+            else:
+                logger.warning(f"⚠️ CLIP Cloud Error {response.status_code}: {response.text}")
+        except ClipUnavailable as e:
+            logger.warning(f"⏭️ CLIP скоринг пропущен: {e}")
+        except Exception as e:
+            logger.error(f"❌ Connection to Yandex Cloud failed: {e}")
+        finally:
+            mime.close()
+        return [NEUTRAL_SCORE] * len(images)
+
+    async def rate_image(self, image, product_name: str, deadline: float = None) -> float:
+        """Скоринг одной картинки через /rate"""
+        mime = CurlMime()
+        try:
+            mime.addpart(name="file", content_type="image/jpeg", filename="image.jpg", data=_to_jpeg_bytes(image))
+            mime.addpart(name="text", data=product_name.encode("utf-8"))
+
+            response = await self._post("/rate", deadline, multipart=mime)
+
+            if response.status_code == 200:
+                return float(response.json().get("score", NEUTRAL_SCORE))
+            logger.warning(f"⚠️ CLIP Cloud Error {response.status_code}: {response.text}")
+        except ClipUnavailable as e:
+            logger.warning(f"⏭️ CLIP скоринг пропущен: {e}")
+        except Exception as e:
+            logger.error(f"❌ Connection to Yandex Cloud failed: {e}")
+        finally:
+            mime.close()
+        return NEUTRAL_SCORE
+
+    async def check_clothing(self, image_url: str, title: str = "", deadline: float = None) -> dict:
+        """Вызов /check-clothing; ошибки транспорта пробрасываются вызывающему"""
+        response = await self._post("/check-clothing", deadline, json={"image_url": image_url, "title": title})
+        response.raise_for_status()
+        return response.json()
+
+    def status(self) -> dict:
+        return {
+            "url": self.base_url,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures
+        }
+
+
+def _to_jpeg_bytes(image) -> bytes:
+    """Принимает PIL-картинку или уже готовые JPEG-байты"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    img_byte_arr = BytesIO()
+    image.save(img_byte_arr, format='JPEG')
+    return img_byte_arr.getvalue()
+
+
+# Общий клиент облачного CLIP для всего приложения
+CLIP_CLIENT = ClipClient(CLIP_URL)
+
+
+async def rate_image_relevance(image, product_name: str, deadline: float = None) -> float:
     """Отправляет картинку на скоринг в Яндекс Облако"""
-    try:
-        # Подготовка картинки
-        img_byte_arr = BytesIO()
-        image.save(img_byte_arr, format='JPEG')
-        img_byte_arr.seek(0)
-
-        files = {'file': ('image.jpg', img_byte_arr, 'image/jpeg')}
-        data = {'text': product_name}
-
-        # Мы стучимся в эндпоинт /rate (его нужно будет добавить в контейнер, см. ниже)
-        # Если в контейнере пока только старый код, этот запрос выдаст 404
-        response = requests.post(f"{CLIP_URL}/rate", files=files, data=data, timeout=60)
-        
-        if response.status_code == 200:
-            return float(response.json().get("score", 50.0))
-        
-        logger.warning(f"⚠️ CLIP Cloud Error {response.status_code}: {response.text}")
-        return 50.0
-    except Exception as e:
-        logger.error(f"❌ Connection to Yandex Cloud failed: {e}")
-        return 50.0
-
-def clip_check_clothing(image_url: str) -> dict:
-    """Старая функция для обратной совместимости"""
-    try:
-        r = requests.post(f"{CLIP_URL}/check-clothing", json={"image_url": image_url}, timeout=15)
-        return r.json()
-    except:
-        return {"ok": True}
+    return await CLIP_CLIENT.rate_image(image, product_name, deadline)
+
 
+async def rate_images_relevance(images: list, product_name: str, deadline: float = None) -> list:
+    """
+    Пакетный скоринг: все картинки уходят одним запросом на /rate-batch
+    и оцениваются за один проход модели. Возвращает список score в том же порядке.
+    """
+    return await CLIP_CLIENT.rate_images(images, product_name, deadline)
 
 
+async def clip_check_clothing(image_url: str, deadline: float = None) -> dict:
+    """Старая функция для обратной совместимости"""
+    try:
+        return await CLIP_CLIENT.check_clothing(image_url, deadline=deadline)
+    except Exception:
+        return {"ok": True}
@@ -1,46 +1,22 @@
-import requests
 import os
-from requests.exceptions import ConnectionError, HTTPError
+from curl_cffi.requests.exceptions import ConnectionError, HTTPError
 
-# Локальный адрес для вашего сервиса на ПК
-CLIP_URL = os.getenv("CLIP_SERVICE_URL", "http://127.0.0.1:8001")
-
-def clip_check(image_url: str, title: str) -> dict:
-    """Проверяет изображение через внешний CLIP-сервис и всегда возвращает словарь."""
-    try:
-        r = requests.post(CLIP_URL, json={
-            "image_url": image_url,
-            "title": title
-        }, timeout=5)
-        r.raise_for_status() # Выбросит исключение для 4xx/5xx ошибок
-        return r.json() # Ожидаем {"ok": bool, "reason": str}
-        
-    except ConnectionError:
-        # Ошибка подключения к 127.0.0.1:8001 (CLIP не запущен на Render)
-        return {"ok": False, "reason": "Connection Error: Не удалось подключиться к CLIP-сервису на 127.0.0.1:8001. Сервис недоступен или не запущен на Render."}
-        
-    except HTTPError as e:
-        # Ошибка HTTP (4xx/5xx) от самого CLIP-сервиса
-        return {"ok": False, "reason": f"CLIP-сервис вернул ошибку: {e}"}
-
-    except Exception as e:
-        # Другая ошибка (например, таймаут, ошибка JSON)
-        return {"ok": False, "reason": f"Неизвестная ошибка при проверке CLIP: {e}"}
-import requests
-from requests.exceptions import ConnectionError, HTTPError
+from utils.clip_client import ClipClient, ClipUnavailable
 
 # Локальный адрес для вашего сервиса на ПК
 CLIP_URL = os.getenv("CLIP_SERVICE_URL", "http://127.0.0.1:8001")
 
-def clip_check(image_url: str, title: str) -> dict:
+# Тот же пул/breaker, что и у облачного клиента, только со своим адресом и коротким таймаутом
+CLIP_LOCAL_CLIENT = ClipClient(CLIP_URL, timeout=5)
+
+async def clip_check(image_url: str, title: str, deadline: float = None) -> dict:
     """Проверяет изображение через внешний CLIP-сервис и всегда возвращает словарь."""
     try:
-        r = requests.post(CLIP_URL, json={
-            "image_url": image_url,
-            "title": title
-        }, timeout=5)
-        r.raise_for_status() # Выбросит исключение для 4xx/5xx ошибок
-        return r.json() # Ожидаем {"ok": bool, "reason": str}
+        return await CLIP_LOCAL_CLIENT.check_clothing(image_url, title, deadline) # Ожидаем {"ok": bool, "reason": str}
+        
+    except ClipUnavailable as e:
+        # Breaker разомкнут или бюджет исчерпан - не ждём таймаута
+        return {"ok": False, "reason": f"CLIP-сервис временно пропущен: {e}"}
         
     except ConnectionError:
         # Ошибка подключения к 127.0.0.1:8001 (CLIP не запущен на Render)
@@ -53,4 +29,3 @@ def clip_check(image_url: str, title: str) -> dict:
     except Exception as e:
         # Другая ошибка (например, таймаут, ошибка JSON)
         return {"ok": False, "reason": f"Неизвестная ошибка при проверке CLIP: {e}"}
-
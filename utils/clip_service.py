@@ -10,7 +10,16 @@ import requests
 from io import BytesIO
 import uvicorn
 import logging
+import os
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
 from fastapi import UploadFile, File, Form
+from starlette.concurrency import run_in_threadpool
 
 # Импортируем CLIP
 try:
@@ -29,6 +38,14 @@ MODEL = None
 PREPROCESS = None
 DEVICE = None
 
+# === Режим инференса ===
+# fp32 - как раньше; int8 - динамическая квантизация Linear-слоёв (только CPU)
+INFERENCE_MODES = ("fp32", "int8")
+INFERENCE_MODE = os.getenv("CLIP_INFERENCE_MODE", "fp32").lower()
+if INFERENCE_MODE not in INFERENCE_MODES:
+    logger.warning(f"⚠️ Неизвестный CLIP_INFERENCE_MODE={INFERENCE_MODE}, используется fp32")
+    INFERENCE_MODE = "fp32"
+
 # === Категории одежды ===
 CLOTHING_CATEGORIES = {
     "ru": [
@@ -69,70 +86,516 @@ PATTERNS = {
     "en": ["solid", "striped", "checkered", "printed", "patterned"]
 }
 
+# === Фиксированные промпты для /check-clothing и /rate ===
+CHECK_CLOTHING_CATEGORIES = ["clothing item", "person wearing clothes", "not clothing"]
+
+RATE_NEGATIVE_QUERIES = [
+    "a size chart table with numbers",
+    "fabric texture close up",
+    "cardboard packaging box"
+]
+
+# === Головы многоголовой классификации (/classify-clothing, /generate-name) ===
+ATTRIBUTE_HEADS = {
+    "type": CLOTHING_CATEGORIES["ru"],
+    "color": COLORS["ru"],
+    "style": STYLES["ru"],
+    "pattern": PATTERNS["ru"],
+}
+
+# === Кэш текстовых эмбеддингов ===
+# Фиксированные словари кодируются один раз при старте, динамические промпты
+# (например, название товара в /rate) попадают в LRU ограниченного размера
+TEXT_CACHE_SIZE = int(os.getenv("CLIP_TEXT_CACHE_SIZE", "1024"))
+
+STATIC_TEXT_FEATURES = {}            # промпт -> нормализованный эмбеддинг
+STATIC_TEXT_MATRICES = {}            # tuple(промпты) -> готовая матрица
+DYNAMIC_TEXT_FEATURES = OrderedDict()
+_TEXT_CACHE_LOCK = threading.Lock()
+
+# === Микробатчинг инференса ===
+# Картинки из параллельных запросов собираются в один батч encode_image
+BATCHING_ENABLED = os.getenv("CLIP_BATCHING", "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("CLIP_MAX_BATCH_SIZE", "16"))
+MAX_BATCH_WAIT_MS = float(os.getenv("CLIP_MAX_BATCH_WAIT_MS", "10"))
+
+
+class InferenceBatcher:
+    """
+    Планировщик инференса: фоновый поток забирает тензоры из очереди,
+    ждёт не дольше max_wait_ms (или пока не наберётся max_batch_size),
+    прогоняет их одним батчем и раздаёт результаты по Future.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._loop, name="clip-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def submit(self, image_input: torch.Tensor) -> Future:
+        """Ставит препроцессированную картинку [3, H, W] в очередь"""
+        future = Future()
+        self._queue.put((image_input, future))
+        return future
+
+    def encode(self, image_input: torch.Tensor) -> torch.Tensor:
+        """Блокирующий вариант submit - для синхронных эндпоинтов"""
+        return self.submit(image_input).result()
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: list):
+        # Отменённые вызывающей стороной Future просто выкидываем
+        batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            with torch.no_grad():
+                image_input = torch.stack([t for t, _ in batch]).to(DEVICE)
+                image_features = MODEL.encode_image(image_input)
+                image_features /= image_features.norm(dim=-1, keepdim=True)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for i, (_, future) in enumerate(batch):
+            future.set_result(image_features[i:i + 1])
+        
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+
+BATCHER = InferenceBatcher(MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+
+# === Кэш эмбеддингов картинок по хэшу содержимого ===
+IMAGE_CACHE_MB = float(os.getenv("CLIP_IMAGE_CACHE_MB", "64"))
+IMAGE_CACHE_DIR = os.getenv("CLIP_IMAGE_CACHE_DIR")  # если задан - вытесненное уходит на диск
+# Предел диска под вытесненные эмбеддинги: сверх него удаляются самые старые файлы (по mtime)
+IMAGE_CACHE_DISK_MB = float(os.getenv("CLIP_IMAGE_CACHE_DISK_MB", "512"))
+
+
+class ImageEmbeddingCache:
+    """
+    LRU эмбеддингов картинок с лимитом по памяти. Ключ - sha256 байтов картинки,
+    так что повторная картинка не проходит ни препроцессинг, ни encode_image.
+    Вытесненные из памяти эмбеддинги опционально сохраняются на диск.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "disk_evictions": 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._trim_disk()
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        # Режим инференса входит в ключ: int8 и fp32 эмбеддинги не смешиваются на диске
+        return f"{INFERENCE_MODE}-{hashlib.sha256(data).hexdigest()}"
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.pt")
+
+    def get(self, key: str):
+        with self._lock:
+            features = self._items.get(key)
+            if features is not None:
+                self._items.move_to_end(key)
+                self.stats["hits"] += 1
+                return features
+        
+        if self.spill_dir and os.path.exists(self._spill_path(key)):
+            try:
+                features = torch.load(self._spill_path(key), map_location="cpu")
+                # Свежий mtime - файл не попадёт под вытеснение с диска первым
+                os.utime(self._spill_path(key))
+            except Exception as e:
+                logger.warning(f"Битый файл кэша эмбеддингов {key}: {e}")
+            else:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                self.put(key, features, spill=False)
+                return features
+        
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, features: torch.Tensor, spill: bool = True):
+        # clone: строка-срез держит всё хранилище батча N x D, а учитываем и пишем на диск только её
+        features = features.detach().cpu().contiguous().clone()
+        size = features.element_size() * features.nelement()
+        evicted = []
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old.element_size() * old.nelement()
+            self._items[key] = features
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                old_key, old_features = self._items.popitem(last=False)
+                self._bytes -= old_features.element_size() * old_features.nelement()
+                evicted.append((old_key, old_features))
+        
+        if self.spill_dir and spill and evicted:
+            written = 0
+            for old_key, old_features in evicted:
+                path = self._spill_path(old_key)
+                if not os.path.exists(path):
+                    try:
+                        torch.save(old_features, path)
+                        written += os.path.getsize(path)
+                    except Exception as e:
+                        logger.warning(f"Не удалось сохранить эмбеддинг на диск: {e}")
+            with self._disk_lock:
+                self._disk_bytes += written
+                over_limit = self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes
+            if over_limit:
+                self._trim_disk()
+
+    def _trim_disk(self):
+        """
+        Удаляет самые старые (по mtime) файлы, пока папка не станет меньше 90% лимита.
+        Размер считается по самой папке: её могут делить несколько процессов сервиса.
+        """
+        with self._disk_lock:
+            files = []
+            for name in os.listdir(self.spill_dir):
+                if not name.endswith(".pt"):
+                    continue
+                path = os.path.join(self.spill_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            if self.max_disk_bytes and total > self.max_disk_bytes:
+                target = self.max_disk_bytes * 0.9
+                for _, size, path in sorted(files):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    removed += 1
+            self._disk_bytes = total
+        if removed:
+            with self._lock:
+                self.stats["disk_evictions"] += removed
+            logger.info(f"🧹 Кэш эмбеддингов на диске: удалено {removed} старых файлов")
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._items),
+                "memory_mb": round(self._bytes / (1024 * 1024), 2),
+                "limit_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "spill_dir": self.spill_dir,
+                "disk_mb": round(self._disk_bytes / (1024 * 1024), 2),
+                "disk_limit_mb": round(self.max_disk_bytes / (1024 * 1024), 2)
+            }
+
+
+IMAGE_CACHE = ImageEmbeddingCache(
+    int(IMAGE_CACHE_MB * 1024 * 1024), IMAGE_CACHE_DIR, int(IMAGE_CACHE_DISK_MB * 1024 * 1024)
+)
+
+def build_model(mode: str, device: str):
+    """Загружает ViT-B/32 и применяет выбранный режим инференса"""
+    # Загружаем модель ViT-B/32 (легкая и быстрая)
+    model, preprocess = clip.load("ViT-B/32", device=device)
+    
+    if mode == "int8":
+        if device != "cpu":
+            logger.warning("⚠️ int8-квантизация доступна только на CPU, используется fp32")
+        else:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    
+    model.eval()
+    return model, preprocess
+
 @app.on_event("startup")
 def load_model():
     """Загрузка CLIP модели при старте сервиса"""
-    global MODEL, PREPROCESS, DEVICE
+    global MODEL, PREPROCESS, DEVICE, INFERENCE_MODE
     
     logger.info("🔄 Загрузка CLIP модели...")
     
     DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-    logger.info(f"📱 Используется устройство: {DEVICE}")
+    if INFERENCE_MODE == "int8" and DEVICE != "cpu":
+        logger.warning("⚠️ int8-квантизация доступна только на CPU, используется fp32")
+        INFERENCE_MODE = "fp32"
+    logger.info(f"📱 Используется устройство: {DEVICE}, режим: {INFERENCE_MODE}")
     
-    # Загружаем модель ViT-B/32 (легкая и быстрая)
-    MODEL, PREPROCESS = clip.load("ViT-B/32", device=DEVICE)
+    MODEL, PREPROCESS = build_model(INFERENCE_MODE, DEVICE)
     
     logger.info("✅ CLIP модель загружена успешно!")
+    
+    warmup_text_cache()
+    
+    if BATCHING_ENABLED:
+        BATCHER.start()
+        logger.info(f"📦 Микробатчинг включён: batch<={MAX_BATCH_SIZE}, wait<={MAX_BATCH_WAIT_MS}ms")
 
-def download_image(url: str) -> Image.Image:
-    """Скачивает изображение по URL"""
+@app.on_event("shutdown")
+def stop_batcher():
+    BATCHER.stop()
+
+def build_prompts(categories: list, language: str = "ru") -> list:
+    """Превращает список категорий в текстовые промпты для CLIP"""
+    if language == "ru":
+        return [f"фотография {cat}" for cat in categories]
+    return [f"a photo of {cat}" for cat in categories]
+
+def encode_text_prompts(prompts: list) -> torch.Tensor:
+    """Кодирует промпты моделью и возвращает нормализованные эмбеддинги"""
+    text_inputs = clip.tokenize(prompts).to(DEVICE)
+    with torch.no_grad():
+        text_features = MODEL.encode_text(text_inputs)
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+    return text_features
+
+def warmup_text_cache():
+    """Один раз кодирует все фиксированные словари и кладёт их в статический кэш"""
+    vocabularies = [
+        build_prompts(CLOTHING_CATEGORIES["ru"], "ru"),
+        build_prompts(COLORS["ru"], "ru"),
+        build_prompts(STYLES["ru"], "ru"),
+        build_prompts(PATTERNS["ru"], "ru"),
+        build_prompts(CHECK_CLOTHING_CATEGORIES, "en"),
+        build_prompts(RATE_NEGATIVE_QUERIES, "en"),
+        # Склеенный словарь всех голов - одна матрица для одного матричного умножения
+        [p for cats in ATTRIBUTE_HEADS.values() for p in build_prompts(cats, "ru")],
+    ]
+    
+    all_prompts = list(dict.fromkeys(p for vocab in vocabularies for p in vocab))
+    features = encode_text_prompts(all_prompts)
+    
+    STATIC_TEXT_FEATURES.clear()
+    STATIC_TEXT_MATRICES.clear()
+    for prompt, feature in zip(all_prompts, features):
+        STATIC_TEXT_FEATURES[prompt] = feature
+    for vocab in vocabularies:
+        STATIC_TEXT_MATRICES[tuple(vocab)] = torch.stack([STATIC_TEXT_FEATURES[p] for p in vocab])
+    
+    logger.info(f"🧠 Закэшировано {len(all_prompts)} текстовых эмбеддингов")
+
+def get_text_features(prompts: list) -> torch.Tensor:
+    """
+    Возвращает матрицу нормализованных эмбеддингов для промптов.
+    Фиксированные словари берутся из статического кэша, остальное - из LRU.
+    """
+    matrix = STATIC_TEXT_MATRICES.get(tuple(prompts))
+    if matrix is not None:
+        return matrix
+    
+    rows = [None] * len(prompts)
+    missing = []
+    with _TEXT_CACHE_LOCK:
+        for i, prompt in enumerate(prompts):
+            feature = STATIC_TEXT_FEATURES.get(prompt)
+            if feature is None:
+                feature = DYNAMIC_TEXT_FEATURES.get(prompt)
+                if feature is not None:
+                    DYNAMIC_TEXT_FEATURES.move_to_end(prompt)
+            if feature is None:
+                missing.append(i)
+            rows[i] = feature
+    
+    if missing:
+        missing_prompts = list(dict.fromkeys(prompts[i] for i in missing))
+        encoded = dict(zip(missing_prompts, encode_text_prompts(missing_prompts)))
+        with _TEXT_CACHE_LOCK:
+            for prompt, feature in encoded.items():
+                DYNAMIC_TEXT_FEATURES[prompt] = feature
+                DYNAMIC_TEXT_FEATURES.move_to_end(prompt)
+            while len(DYNAMIC_TEXT_FEATURES) > TEXT_CACHE_SIZE:
+                DYNAMIC_TEXT_FEATURES.popitem(last=False)
+        for i in missing:
+            rows[i] = encoded[prompts[i]]
+    
+    return torch.stack(rows)
+
+def download_image(url: str) -> bytes:
+    """Скачивает изображение по URL и возвращает сырые байты (ключ для кэша эмбеддингов)"""
     try:
         response = requests.get(url, timeout=10, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
         response.raise_for_status()
-        return Image.open(BytesIO(response.content)).convert("RGB")
+        return response.content
     except Exception as e:
         raise HTTPException(400, f"Не удалось загрузить изображение: {str(e)}")
 
-def classify_with_clip(image: Image.Image, categories: list, language: str = "ru") -> dict:
+def encode_image(image: Image.Image) -> torch.Tensor:
+    """Препроцессинг + encode_image, возвращает нормализованный эмбеддинг [1, D]"""
+    if BATCHER.running:
+        return BATCHER.encode(PREPROCESS(image))
+    
+    image_input = PREPROCESS(image).unsqueeze(0).to(DEVICE)
+    with torch.no_grad():
+        image_features = MODEL.encode_image(image_input)
+        image_features /= image_features.norm(dim=-1, keepdim=True)
+    return image_features
+
+def encode_images(images: list) -> torch.Tensor:
+    """Кодирует список картинок одним батчем, возвращает [N, D]"""
+    if BATCHER.running:
+        # Кладём всё в очередь разом - планировщик соберёт их в один батч
+        futures = [BATCHER.submit(PREPROCESS(image)) for image in images]
+        return torch.cat([f.result() for f in futures])
+    
+    image_input = torch.stack([PREPROCESS(image) for image in images]).to(DEVICE)
+    with torch.no_grad():
+        image_features = MODEL.encode_image(image_input)
+        image_features /= image_features.norm(dim=-1, keepdim=True)
+    return image_features
+
+def encode_image_bytes(images_data: list) -> list:
     """
-    Классифицирует изображение по списку категорий
-    Возвращает: {"category": "название", "confidence": 0.95}
+    Возвращает эмбеддинги [1, D] для сырых байтов картинок (None для битых).
+    Повторные картинки берутся из IMAGE_CACHE, остальные кодируются одним батчем.
     """
-    # Подготовка изображения
-    image_input = PREPROCESS(image).unsqueeze(0).to(DEVICE)
+    results = [None] * len(images_data)
+    pending = OrderedDict()  # ключ -> индексы картинок с этим содержимым
+    for i, data in enumerate(images_data):
+        key = IMAGE_CACHE.key_for(data)
+        if key in pending:
+            pending[key].append(i)
+            continue
+        cached = IMAGE_CACHE.get(key)
+        if cached is not None:
+            results[i] = cached.to(DEVICE)
+        else:
+            pending[key] = [i]
     
-    # Подготовка текстовых промптов
-    if language == "ru":
-        text_prompts = [f"фотография {cat}" for cat in categories]
-    else:
-        text_prompts = [f"a photo of {cat}" for cat in categories]
+    images, keys = [], []
+    for key, indices in pending.items():
+        try:
+            images.append(Image.open(BytesIO(images_data[indices[0]])).convert("RGB"))
+            keys.append(key)
+        except Exception as e:
+            logger.warning(f"Не удалось открыть картинку #{indices[0]}: {e}")
     
-    text_inputs = clip.tokenize(text_prompts).to(DEVICE)
+    if images:
+        image_features = encode_images(images)
+        for row, key in enumerate(keys):
+            features = image_features[row:row + 1]
+            IMAGE_CACHE.put(key, features)
+            for i in pending[key]:
+                results[i] = features
+    return results
+
+def image_features_for(image) -> torch.Tensor:
+    """Эмбеддинг для PIL-картинки или сырых байтов (байты идут через кэш)"""
+    if isinstance(image, (bytes, bytearray)):
+        features = encode_image_bytes([bytes(image)])[0]
+        if features is None:
+            raise HTTPException(400, "Не удалось открыть изображение")
+        return features
+    return encode_image(image)
+
+def top_categories(probs: torch.Tensor, categories: list, top_k: int = 3) -> list:
+    """Превращает вектор вероятностей в список [{"category", "confidence"}]"""
+    values, indices = probs.topk(min(top_k, len(categories)))
+    return [
+        {"category": categories[idx.item()], "confidence": val.item()}
+        for val, idx in zip(values, indices)
+    ]
+
+def classify_with_clip(image, categories: list, language: str = "ru") -> dict:
+    """
+    Классифицирует изображение (PIL или сырые байты) по списку категорий
+    Возвращает: {"category": "название", "confidence": 0.95}
+    """
+    # Текстовые эмбеддинги берутся из кэша (уже нормализованы)
+    text_features = get_text_features(build_prompts(categories, language))
+    image_features = image_features_for(image)
     
-    # Получаем эмбеддинги
+    # Вычисляем сходство
     with torch.no_grad():
-        image_features = MODEL.encode_image(image_input)
-        text_features = MODEL.encode_text(text_inputs)
-        
-        # Нормализуем
-        image_features /= image_features.norm(dim=-1, keepdim=True)
-        text_features /= text_features.norm(dim=-1, keepdim=True)
-        
-        # Вычисляем сходство
         similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
     
     # Находим лучшее совпадение
-    values, indices = similarity[0].topk(3)
+    return top_categories(similarity[0], categories, 3)
+
+def classify_multi_head(image, heads: dict, language: str = "ru", top_k: int = 3) -> dict:
+    """
+    Классифицирует изображение сразу по нескольким словарям (головам).
+    Картинка кодируется один раз, сходство со всеми словарями считается
+    одним матричным умножением, softmax - отдельно внутри каждой головы.
+    Возвращает: {"type": [...top-k...], "color": [...], ...}
+    """
+    prompts, spans = [], {}
+    for name, categories in heads.items():
+        spans[name] = (len(prompts), len(prompts) + len(categories))
+        prompts.extend(build_prompts(categories, language))
     
-    results = []
-    for i in range(3):
-        results.append({
-            "category": categories[indices[i].item()],
-            "confidence": values[i].item()
-        })
+    text_features = get_text_features(prompts)
+    image_features = image_features_for(image)
+    
+    with torch.no_grad():
+        logits = (100.0 * image_features @ text_features.T)[0]
     
+    results = {}
+    for name, (start, end) in spans.items():
+        probs = logits[start:end].softmax(dim=-1)
+        results[name] = top_categories(probs, heads[name], top_k)
     return results
 
 # === API Endpoints ===
@@ -153,8 +616,7 @@ def check_clothing(request: ClothingCheckRequest):
         image = download_image(request.image_url)
         
         # Проверяем, это одежда или нет
-        categories = ["clothing item", "person wearing clothes", "not clothing"]
-        results = classify_with_clip(image, categories, language="en")
+        results = classify_with_clip(image, CHECK_CLOTHING_CATEGORIES, language="en")
         
         is_clothing = results[0]["category"] in ["clothing item", "person wearing clothes"]
         confidence = results[0]["confidence"]
@@ -177,17 +639,12 @@ def classify_clothing_endpoint(request: ImageRequest):
     try:
         image = download_image(request.image_url)
         
-        # 1. Определяем тип одежды
-        clothing_type = classify_with_clip(image, CLOTHING_CATEGORIES["ru"], "ru")
-        
-        # 2. Определяем цвет
-        color_result = classify_with_clip(image, COLORS["ru"], "ru")
-        
-        # 3. Определяем стиль (опционально)
-        style_result = classify_with_clip(image, STYLES["ru"], "ru")
-        
-        # 4. Определяем паттерн
-        pattern_result = classify_with_clip(image, PATTERNS["ru"], "ru")
+        # Тип, цвет, стиль и паттерн - за один проход по картинке
+        heads = classify_multi_head(image, ATTRIBUTE_HEADS, "ru")
+        clothing_type = heads["type"]
+        color_result = heads["color"]
+        style_result = heads["style"]
+        pattern_result = heads["pattern"]
         
         return {
             "success": True,
@@ -214,11 +671,12 @@ def generate_clothing_name(request: ImageRequest):
     try:
         image = download_image(request.image_url)
         
-        # Получаем все характеристики
-        clothing_type = classify_with_clip(image, CLOTHING_CATEGORIES["ru"], "ru")
-        color_result = classify_with_clip(image, COLORS["ru"], "ru")
-        style_result = classify_with_clip(image, STYLES["ru"], "ru")
-        pattern_result = classify_with_clip(image, PATTERNS["ru"], "ru")
+        # Получаем все характеристики за один проход
+        heads = classify_multi_head(image, ATTRIBUTE_HEADS, "ru")
+        clothing_type = heads["type"]
+        color_result = heads["color"]
+        style_result = heads["style"]
+        pattern_result = heads["pattern"]
         
         # Формируем название
         type_name = clothing_type[0]["category"]
@@ -267,9 +725,64 @@ def health_check():
     return {
         "status": "ok",
         "model_loaded": MODEL is not None,
-        "device": str(DEVICE) if DEVICE else "unknown"
+        "device": str(DEVICE) if DEVICE else "unknown",
+        "inference_mode": INFERENCE_MODE,
+        "text_cache": {
+            "static": len(STATIC_TEXT_FEATURES),
+            "dynamic": len(DYNAMIC_TEXT_FEATURES),
+            "dynamic_limit": TEXT_CACHE_SIZE
+        },
+        "batching": {
+            "enabled": BATCHER.running,
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_wait_ms": MAX_BATCH_WAIT_MS,
+            **BATCHER.stats
+        },
+        "image_cache": IMAGE_CACHE.info()
     }
 
+def rate_images(images_data: list, text: str) -> list:
+    """
+    Считает score (0-100) соответствия каждой картинки названию товара.
+    Все картинки проходят через модель одним батчем.
+    """
+    # Список для сравнения: 
+    # 1. То, что мы ищем (название товара)
+    # 2. Таблица размеров (мусор)
+    # 3. Текстура ткани (мусор)
+    # 4. Упаковка/коробка (мусор)
+    search_query = f"a photo of {text}"
+    all_categories = [search_query] + RATE_NEGATIVE_QUERIES
+    
+    # Внимание: для точности лучше использовать английский для технических промптов
+    text_features = get_text_features(build_prompts(all_categories, "en"))
+    
+    # Битые картинки не валят весь батч - им ставим нейтральный score
+    scores = [50.0] * len(images_data)
+    features = encode_image_bytes(images_data)
+    positions = [i for i, f in enumerate(features) if f is not None]
+    
+    if not positions:
+        return scores
+    
+    image_features = torch.cat([features[i] for i in positions])
+    with torch.no_grad():
+        similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
+    
+    for row, i in enumerate(positions):
+        # Как и раньше, основной запрос учитывается, только если он в топ-3
+        results = top_categories(similarity[row], all_categories, 3)
+        scores[i] = 0
+        for res in results:
+            if res["category"] == search_query:
+                scores[i] = res["confidence"] * 100
+                break
+    return scores
+
+def rate_image(image_data: bytes, text: str) -> float:
+    """Считает score (0-100) соответствия картинки названию товара"""
+    return rate_images([image_data], text)[0]
+
 @app.post("/rate")
 async def rate_image_endpoint(file: UploadFile = File(...), text: str = Form(...)):
     """
@@ -279,32 +792,10 @@ async def rate_image_endpoint(file: UploadFile = File(...), text: str = Form(...
     try:
         # Читаем файл, который прислал бот
         image_data = await file.read()
-        image = Image.open(BytesIO(image_data)).convert("RGB")
         
-        # Список для сравнения: 
-        # 1. То, что мы ищем (название товара)
-        # 2. Таблица размеров (мусор)
-        # 3. Текстура ткани (мусор)
-        # 4. Упаковка/коробка (мусор)
-        search_query = f"a photo of {text}"
-        negative_queries = [
-            "a size chart table with numbers",
-            "fabric texture close up",
-            "cardboard packaging box"
-        ]
-        
-        all_categories = [search_query] + negative_queries
-        
-        # Используем существующую в файле функцию классификации
-        # Внимание: для точности лучше использовать английский для технических промптов
-        results = classify_with_clip(image, all_categories, language="en")
-        
-        # Ищем, какой балл получил наш основной запрос
-        main_score = 0
-        for res in results:
-            if res["category"] == search_query:
-                main_score = res["confidence"] * 100
-                break
+        # Инференс уходит в поток, чтобы не блокировать event loop
+        # и чтобы параллельные /rate могли собраться в один батч
+        main_score = await run_in_threadpool(rate_image, image_data, text)
         
         # Если победил мусор (таблица размеров), основной score будет очень низким
         return {"score": main_score}
@@ -313,5 +804,20 @@ async def rate_image_endpoint(file: UploadFile = File(...), text: str = Form(...
         logger.error(f"Error in rate-endpoint: {e}")
         return {"score": 50.0, "error": str(e)}
 
+@app.post("/rate-batch")
+async def rate_batch_endpoint(files: List[UploadFile] = File(...), text: str = Form(...)):
+    """
+    Пакетная версия /rate: N картинок + одно название товара,
+    все картинки оцениваются за один проход модели.
+    """
+    try:
+        images_data = [await f.read() for f in files]
+        scores = await run_in_threadpool(rate_images, images_data, text)
+        return {"scores": scores}
+    
+    except Exception as e:
+        logger.error(f"Error in rate-batch-endpoint: {e}")
+        return {"scores": [50.0] * len(files), "error": str(e)}
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8001, log_level="info")
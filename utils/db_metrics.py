@@ -0,0 +1,123 @@
+# utils/db_metrics.py
+# Метрики пулов соединений SQLAlchemy: ожидание соединения (гистограмма),
+# выдачи/возвраты, инвалидации и таймауты. Ожидание меряется в QueuePool._do_get,
+# остальное собирается из событий пула.
+import time
+import bisect
+import logging
+import threading
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы ожидания, мс (последняя корзина - всё, что больше)
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolMetrics:
+    """Счётчики одного пула; обновляются из любых потоков"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.counters = {
+            "connects": 0, "checkouts": 0, "checkins": 0,
+            "invalidations": 0, "soft_invalidations": 0, "timeouts": 0
+        }
+
+    def incr(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def observe_wait(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS_MS, ms)] += 1
+            self.wait_total_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            observed = sum(self.wait_buckets)
+            histogram = {f"le_{b}ms": n for b, n in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+            histogram[f"gt_{WAIT_BUCKETS_MS[-1]}ms"] = self.wait_buckets[-1]
+            data = {
+                **self.counters,
+                "checkout_wait_ms": {
+                    "count": observed,
+                    "avg": round(self.wait_total_ms / observed, 3) if observed else 0.0,
+                    "max": round(self.wait_max_ms, 3),
+                    "histogram": histogram
+                }
+            }
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            data.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "timeout": pool.timeout()
+            })
+        elif pool is not None:
+            data["status"] = pool.status()
+        return data
+
+
+POOL_METRICS = {}
+
+
+def _instrumented(pool_cls):
+    """Подкласс пула, который меряет время получения соединения (включая ожидание в очереди)"""
+
+    class InstrumentedPool(pool_cls):
+        metrics: PoolMetrics = None
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                self.metrics.incr("timeouts")
+                raise
+            finally:
+                self.metrics.observe_wait(time.perf_counter() - started)
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_cls.__name__}"
+    return InstrumentedPool
+
+
+def instrumented_pool_class(name: str, is_async: bool):
+    """Класс пула для create_engine(poolclass=...) с метриками под именем name"""
+    metrics = POOL_METRICS.setdefault(name, PoolMetrics(name))
+    pool_cls = _instrumented(AsyncAdaptedQueuePool if is_async else QueuePool)
+    pool_cls.metrics = metrics
+    return pool_cls
+
+
+def attach(name: str, engine):
+    """Подписывается на события пула движка (для async - передавать async_engine.sync_engine)"""
+    metrics = POOL_METRICS.setdefault(name, PoolMetrics(name))
+    metrics.pool = engine.pool
+
+    event.listen(engine, "connect", lambda *a: metrics.incr("connects"))
+    event.listen(engine, "checkout", lambda *a: metrics.incr("checkouts"))
+    event.listen(engine, "checkin", lambda *a: metrics.incr("checkins"))
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.incr("invalidations")
+        logger.warning(f"🔌 Пул {name}: соединение инвалидировано ({exception})")
+
+    event.listen(engine, "invalidate", on_invalidate)
+    event.listen(engine, "soft_invalidate", lambda *a: metrics.incr("soft_invalidations"))
+    return metrics
+
+
+def pool_metrics() -> dict:
+    return {name: m.snapshot() for name, m in POOL_METRICS.items()}
@@ -0,0 +1,133 @@
+# utils/executors.py
+# Пулы исполнителей на весь процесс: создаются на старте приложения и закрываются при остановке.
+# io  - потоки для сетевых загрузок,
+# cpu - процессы для декодирования и фильтров PIL (не упираются в GIL),
+# storage - потоки для загрузки/удаления объектов в хранилище (utils/storage.py).
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "16"))
+CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", str(os.cpu_count() or 2)))
+CPU_POOL_KIND = os.getenv("CPU_POOL_KIND", "process")  # process | thread
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")
+STORAGE_POOL_SIZE = int(os.getenv("STORAGE_POOL_SIZE", "8"))
+
+
+class BoundedPool:
+    """
+    Обёртка над executor'ом с метриками: сколько задач в работе,
+    глубина очереди (задачи сверх числа воркеров) и её максимум.
+    """
+
+    def __init__(self, name: str, kind: str, workers: int):
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.stats = {"completed": 0, "failed": 0, "max_queue_depth": 0, "restarts": 0}
+
+    def _create_executor(self):
+        if self.kind == "process":
+            context = multiprocessing.get_context(CPU_POOL_START_METHOD)
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-pool")
+
+    def start(self):
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = self._create_executor()
+        logger.info(f"🧵 Пул {self.name} запущен: {self.kind} x{self.workers}")
+
+    def _restart(self, broken):
+        """
+        Заменяет сломанный ProcessPoolExecutor (воркер умер: OOM, падение кодека).
+        Сломанный пул сам не восстанавливается - без замены падали бы все следующие задачи.
+        """
+        with self._lock:
+            # Пул уже заменили параллельно или остановили - ничего не делаем
+            if self._executor is not broken:
+                return
+            self._executor = self._create_executor()
+            self.stats["restarts"] += 1
+        logger.warning(f"♻️ Пул {self.name} пересоздан: воркер-процесс умер")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.workers)
+
+    async def run(self, fn, *args):
+        """Выполняет fn(*args) в пуле и ждёт результат, не блокируя event loop"""
+        if self._executor is None:
+            self.start()
+        with self._lock:
+            self._in_flight += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue_depth)
+        try:
+            executor = self._executor
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # Один повтор на свежем пуле
+                self._restart(executor)
+                if self._executor is None:
+                    raise
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except Exception:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self.stats["completed"] += 1
+        return result
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "running": self._executor is not None,
+                "in_flight": self._in_flight,
+                "queue_depth": self.queue_depth,
+                **self.stats
+            }
+
+
+IO_POOL = BoundedPool("io", "thread", IO_POOL_SIZE)
+CPU_POOL = BoundedPool("cpu", CPU_POOL_KIND, CPU_POOL_SIZE)
+STORAGE_POOL = BoundedPool("storage", "thread", STORAGE_POOL_SIZE)
+
+
+def start_pools():
+    IO_POOL.start()
+    CPU_POOL.start()
+    STORAGE_POOL.start()
+
+
+def shutdown_pools():
+    IO_POOL.shutdown()
+    CPU_POOL.shutdown()
+    STORAGE_POOL.shutdown()
+
+
+def pools_info() -> dict:
+    return {"io": IO_POOL.info(), "cpu": CPU_POOL.info(), "storage": STORAGE_POOL.info()}
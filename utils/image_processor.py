@@ -113,3 +113,55 @@ def convert_variant_to_bytes(img: Image.Image, format: str = "JPEG", quality: in
     
     img.save(output, format=format, quality=quality, optimize=True)
     return output.getvalue()
+
+def analyze_candidate(data: bytes, preview_size: int = 336) -> dict:
+    """
+    Декодирует кандидата с маркетплейса сразу в уменьшенном виде, считает плотность
+    границ (таблицы размеров и коллажи дают много резких границ) и готовит JPEG-превью для CLIP.
+    Все эвристики работают на картинке ~preview_size, полное разрешение не декодируется.
+    Работает в процессном пуле, поэтому принимает и возвращает только байты/числа.
+    """
+    from PIL import ImageFilter, ImageStat
+    
+    img = Image.open(BytesIO(data))
+    # JPEG декодируется сразу в 1/2..1/8 масштаба; для остальных форматов
+    # thumbnail с reducing_gap сначала делает быстрый reduce(), потом ресемплинг
+    img.draft("RGB", (preview_size, preview_size))
+    img.thumbnail((preview_size, preview_size), reducing_gap=3.0)
+    img = img.convert("RGB")
+    
+    edge_density = ImageStat.Stat(img.convert("L").filter(ImageFilter.FIND_EDGES)).mean[0]
+    
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return {"edge_density": edge_density, "preview": out.getvalue(), "size": img.size}
+
+# Размеры производных для WebApp: сетка гардероба, карточка вещи, полноэкранный просмотр
+DERIVATIVE_SIZES = {"grid": 320, "card": 640, "full": 1280}
+
+def make_derivatives(data: bytes, sizes: dict = None, webp_quality: int = 80, jpeg_quality: int = 85) -> dict:
+    """
+    Готовит уменьшенные копии картинки: для каждого размера WebP и JPEG (запасной для старых клиентов).
+    Картинка декодируется один раз, каждый следующий размер получается из предыдущего.
+    Меньше оригинала не увеличиваем. Работает в процессном пуле: на входе и выходе только байты.
+    Возвращает {name: {"webp": bytes, "jpeg": bytes, "size": (w, h)}}.
+    """
+    sizes = sizes or DERIVATIVE_SIZES
+    img = Image.open(BytesIO(data))
+    img.draft("RGB", (max(sizes.values()),) * 2)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    else:
+        img = img.convert("RGB")
+    
+    result = {}
+    for name, size in sorted(sizes.items(), key=lambda kv: kv[1], reverse=True):
+        img.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        webp, jpeg = BytesIO(), BytesIO()
+        img.save(webp, format="WEBP", quality=webp_quality, method=4)
+        img.save(jpeg, format="JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+        result[name] = {"webp": webp.getvalue(), "jpeg": jpeg.getvalue(), "size": img.size}
+    return result
@@ -0,0 +1,208 @@
+# utils/kv_store.py
+# Простые key-value хранилища с TTL и ограничением числа записей.
+# memory - словарь внутри процесса; sqlite - файл на локальном диске,
+# общий для всех воркеров uvicorn на одной машине и переживающий рестарт.
+import os
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore:
+    """LRU в памяти процесса с TTL на запись"""
+
+    def __init__(self, ttl: float, max_entries: int, on_evict: Optional[Callable] = None):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.on_evict = on_evict
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        expired = None
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.time():
+                del self._items[key]
+                expired = value
+            else:
+                self._items.move_to_end(key)
+                return value
+        self._evicted(key, expired)
+        return None
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        evicted = []
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.time() + (ttl or self.ttl), value)
+            while len(self._items) > self.max_entries:
+                old_key, (_, old_value) = self._items.popitem(last=False)
+                evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            self._evicted(old_key, old_value)
+
+    def pop(self, key: str) -> Any:
+        """Удаляет запись без on_evict и возвращает её значение (или None)"""
+        with self._lock:
+            item = self._items.pop(key, None)
+        if item is None or item[0] <= time.time():
+            return None
+        return item[1]
+
+    def purge(self) -> int:
+        """Удаляет все просроченные записи, возвращает их количество"""
+        now = time.time()
+        with self._lock:
+            expired = [(k, v) for k, (exp, v) in self._items.items() if exp <= now]
+            for k, _ in expired:
+                del self._items[k]
+        for k, v in expired:
+            self._evicted(k, v)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _evicted(self, key, value):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(key, value)
+        except Exception as e:
+            logger.warning(f"on_evict для {key} упал: {e}")
+
+
+class SQLiteStore:
+    """
+    Хранилище в SQLite: значения сериализуются pickle, вытеснение - по давности доступа.
+    Соединение своё на каждый поток, WAL позволяет читать параллельно из нескольких процессов.
+    """
+
+    def __init__(self, path: str, table: str, ttl: float, max_entries: int, on_evict: Optional[Callable] = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.on_evict = on_evict
+        self._local = threading.local()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_accessed ON {table} (accessed_at)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_expires ON {table} (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            deleted = conn.execute(f"DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?", (key, now)).rowcount
+            if deleted:
+                self._evicted(key, row[0])
+            return None
+        conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        conn = self._conn()
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, blob, now + (ttl or self.ttl), now)
+            )
+            overflow = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+            evicted = []
+            if overflow > 0:
+                evicted = conn.execute(
+                    f"SELECT key, value FROM {self.table} ORDER BY accessed_at LIMIT ?", (overflow,)
+                ).fetchall()
+                conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(k,) for k, _ in evicted])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for old_key, old_blob in evicted:
+            self._evicted(old_key, old_blob)
+
+    def pop(self, key: str) -> Any:
+        """Удаляет запись без on_evict и возвращает её значение (или None)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None or row[1] <= time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def purge(self) -> int:
+        """Удаляет все просроченные записи, возвращает их количество"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute(f"SELECT key, value FROM {self.table} WHERE expires_at <= ?", (now,)).fetchall()
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for key, blob in expired:
+            self._evicted(key, blob)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evicted(self, key, blob):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(key, pickle.loads(blob))
+        except Exception as e:
+            logger.warning(f"on_evict для {key} упал: {e}")
+
+
+def create_store(backend: str, name: str, ttl: float, max_entries: int,
+                 path: str = None, on_evict: Optional[Callable] = None):
+    """Фабрика хранилища по имени бэкенда: "memory" или "sqlite" """
+    if backend == "sqlite":
+        return SQLiteStore(path or f"data/{name}.sqlite3", name, ttl, max_entries, on_evict)
+    if backend != "memory":
+        logger.warning(f"⚠️ Неизвестный бэкенд хранилища {backend!r} для {name}, используется memory")
+    return MemoryStore(ttl, max_entries, on_evict)
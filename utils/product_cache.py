@@ -0,0 +1,45 @@
+# utils/product_cache.py
+# Общий кэш разобранных товаров маркетплейса по nm_id:
+# название, корзина, URL кандидатов, score и байты превью.
+# Повторный импорт того же товара любым пользователем не ходит ни в WB, ни в CLIP.
+# get_product/put_product блокирующие (при sqlite - запись на диск и pickle превью):
+# из async-кода их нужно вызывать через executors.IO_POOL.run.
+import os
+import logging
+
+from utils.kv_store import create_store
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_CACHE_BACKEND = os.getenv("PRODUCT_CACHE_BACKEND", "memory")  # memory | sqlite
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", str(6 * 3600)))
+PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", "500"))
+PRODUCT_CACHE_PATH = os.getenv("PRODUCT_CACHE_PATH", "data/product_cache.sqlite3")
+
+PRODUCT_CACHE = create_store(
+    PRODUCT_CACHE_BACKEND, "product_cache",
+    ttl=PRODUCT_CACHE_TTL, max_entries=PRODUCT_CACHE_MAX_ENTRIES, path=PRODUCT_CACHE_PATH
+)
+
+
+def _key(marketplace: str, product_id) -> str:
+    return f"{marketplace}:{product_id}"
+
+
+def get_product(product_id, marketplace: str = "wb"):
+    """
+    Возвращает закэшированный товар или None:
+    {"title", "basket", "candidates": [{"key", "url", "data", "score", "is_bad"}, ...]}
+    """
+    try:
+        return PRODUCT_CACHE.get(_key(marketplace, product_id))
+    except Exception as e:
+        logger.warning(f"⚠️ Кэш товаров недоступен: {e}")
+        return None
+
+
+def put_product(product_id, entry: dict, marketplace: str = "wb"):
+    try:
+        PRODUCT_CACHE.set(_key(marketplace, product_id), entry)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось записать товар в кэш: {e}")
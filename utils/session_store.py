@@ -0,0 +1,109 @@
+# utils/session_store.py
+# Сессии выбора варианта (temp_id -> кандидаты и превью) между
+# /add-marketplace-with-variants и /select-variant.
+# Сессии живут VARIANT_SESSION_TTL секунд; у просроченных и вытесненных
+# сессий временные превью удаляются из хранилища картинок.
+# Все функции блокирующие (SQLite, удаление из S3, счётчики ссылок в БД):
+# из async-кода их нужно вызывать через executors.IO_POOL.run.
+import os
+import time
+import logging
+
+from utils.kv_store import create_store
+from utils.storage import delete_images
+
+logger = logging.getLogger(__name__)
+
+# sqlite - общий файл для всех воркеров uvicorn, переживает рестарт; memory - только текущий процесс
+VARIANT_SESSION_BACKEND = os.getenv("VARIANT_SESSION_BACKEND", "sqlite")
+VARIANT_SESSION_TTL = float(os.getenv("VARIANT_SESSION_TTL", "1800"))
+VARIANT_SESSION_MAX_ENTRIES = int(os.getenv("VARIANT_SESSION_MAX_ENTRIES", "1000"))
+VARIANT_SESSION_PATH = os.getenv("VARIANT_SESSION_PATH", "data/variant_sessions.sqlite3")
+# Не чаще, чем раз в столько секунд, чистим просроченные сессии
+VARIANT_SESSION_PURGE_INTERVAL = float(os.getenv("VARIANT_SESSION_PURGE_INTERVAL", "60"))
+# Оригиналы вариантов сессии (байты с маркетплейса) лежат здесь до выбора
+VARIANT_SPILL_DIR = os.getenv("VARIANT_SPILL_DIR", "data/variant_spill")
+
+
+def spill_path(temp_id: str, v_key: str) -> str:
+    return os.path.join(VARIANT_SPILL_DIR, f"{temp_id}_{v_key}.bin")
+
+
+def write_spill(path: str, data: bytes):
+    """Атомарно пишет оригинал на диск: читатель видит либо весь файл, либо ничего"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_spill(path: str):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def cleanup_session(temp_id: str, session: dict):
+    """Удаляет временные превью и сохранённые оригиналы сессии"""
+    # Все превью сессии - одним пакетным удалением
+    delete_images(list((session or {}).get("previews", {}).values()))
+    for path in (session or {}).get("spill", {}).values():
+        try: os.remove(path)
+        except OSError: pass
+
+
+def _on_evict(temp_id: str, session: dict):
+    logger.info(f"🧹 Сессия вариантов {temp_id} истекла, превью удалены")
+    cleanup_session(temp_id, session)
+
+
+SESSIONS = create_store(
+    VARIANT_SESSION_BACKEND, "variant_sessions",
+    ttl=VARIANT_SESSION_TTL, max_entries=VARIANT_SESSION_MAX_ENTRIES,
+    path=VARIANT_SESSION_PATH, on_evict=_on_evict
+)
+
+_last_purge = 0.0
+
+
+def _purge_orphan_spills():
+    """Оригиналы, дописанные фоном уже после закрытия сессии, удаляются по возрасту"""
+    if not os.path.isdir(VARIANT_SPILL_DIR):
+        return
+    cutoff = time.time() - VARIANT_SESSION_TTL
+    for name in os.listdir(VARIANT_SPILL_DIR):
+        path = os.path.join(VARIANT_SPILL_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def purge_expired() -> int:
+    global _last_purge
+    _last_purge = time.monotonic()
+    try:
+        _purge_orphan_spills()
+        return SESSIONS.purge()
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось почистить сессии вариантов: {e}")
+        return 0
+
+
+def save_session(temp_id: str, session: dict):
+    if time.monotonic() - _last_purge >= VARIANT_SESSION_PURGE_INTERVAL:
+        purge_expired()
+    SESSIONS.set(temp_id, session)
+
+
+def get_session(temp_id: str):
+    return SESSIONS.get(temp_id)
+
+
+def pop_session(temp_id: str):
+    """Забирает сессию; превью удаляет вызывающий, когда они больше не нужны"""
+    return SESSIONS.pop(temp_id)
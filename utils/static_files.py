@@ -0,0 +1,89 @@
+# utils/static_files.py
+# Раздача /static с долгим кэшем для картинок.
+# Файлы в static/images пишутся один раз под уникальным (uuid или sha256) именем
+# и больше не меняются, поэтому имя файла - сильный ETag, а кэш можно делать immutable.
+import os
+import stat
+import mimetypes
+
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, QueryParams
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+
+from utils.image_processor import DERIVATIVE_SIZES
+from utils.storage import STATIC_IMMUTABLE_MAX_AGE
+
+mimetypes.add_type("image/webp", ".webp")
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles, который для картинок из immutable_dirs:
+    - отдаёт Cache-Control: public, max-age=..., immutable и сильный ETag;
+    - отвечает 304 на совпавший If-None-Match;
+    - по ?size=grid|card|full отдаёт уменьшенную копию <name>_<size> (см. make_derivatives);
+    - отдаёт WebP-вариант рядом с файлом, если клиент принимает image/webp (Vary: Accept).
+    Range-запросы обрабатывает FileResponse.
+    """
+
+    def __init__(self, *args, immutable_dirs=("images",), max_age: int = STATIC_IMMUTABLE_MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable_dirs = tuple(immutable_dirs)
+        self.max_age = max_age
+
+    def _is_immutable(self, path: str) -> bool:
+        return path.replace(os.sep, "/").split("/", 1)[0] in self.immutable_dirs
+
+    def _candidates(self, path: str, scope) -> list:
+        """Пути-кандидаты в порядке предпочтения; исходный путь - всегда последний"""
+        stem, ext = os.path.splitext(path)
+        size = QueryParams(scope.get("query_string", b"")).get("size")
+        base = f"{stem}_{size}" if size in DERIVATIVE_SIZES else stem
+
+        candidates = []
+        accept = Headers(scope=scope).get("accept", "")
+        if ext.lower() != ".webp" and "image/webp" in accept:
+            candidates.append(f"{base}.webp")
+        if base != stem:
+            candidates.append(f"{base}.jpg")
+        candidates.append(path)
+        return candidates
+
+    async def get_response(self, path: str, scope) -> Response:
+        if not self._is_immutable(path):
+            return await super().get_response(path, scope)
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        for candidate in self._candidates(path, scope):
+            full_path, stat_result = await run_in_threadpool(self.lookup_path, candidate)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                return self._immutable_response(full_path, stat_result, scope)
+        # 404 и прочие случаи - как в обычном StaticFiles
+        return await super().get_response(path, scope)
+
+    def _immutable_response(self, full_path: str, stat_result: os.stat_result, scope) -> Response:
+        # Имя файла уникально для содержимого - это сильный валидатор
+        headers = {
+            "etag": f'"{os.path.basename(full_path)}"',
+            "cache-control": f"public, max-age={self.max_age}, immutable",
+            "vary": "Accept",
+        }
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        if if_none_match and self._etag_matches(headers["etag"], if_none_match):
+            return Response(status_code=304, headers=headers)
+
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        response = FileResponse(full_path, stat_result=stat_result, media_type=media_type)
+        response.headers.update(headers)
+        return response
+
+    @staticmethod
+    def _etag_matches(etag: str, if_none_match: str) -> bool:
+        if if_none_match.strip() == "*":
+            return True
+        # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags
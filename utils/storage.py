@@ -1,56 +1,337 @@
 # storage.py
 import os
+import re
 import uuid
-from typing import Tuple, Optional
+import hashlib
+import logging
+import mimetypes
+import threading
+from typing import Iterable, List, Optional
+from urllib.parse import urlparse
+
+from utils import executors
+
+logger = logging.getLogger(__name__)
 
 # Опции: "s3" или "local"
 STORAGE_TYPE = os.getenv("STORAGE_TYPE", "local")  # set to "s3" to enable S3
 LOCAL_DIR = os.getenv("LOCAL_IMAGE_DIR", "static/images")  # relative to project root
+LOCAL_URL_PREFIX = "/static/images/"
 
 # Для S3 (если включено)
 S3_BUCKET = os.getenv("S3_BUCKET")
 S3_PREFIX = os.getenv("S3_PREFIX", "images/")
 
 S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "https://storage.yandexcloud.net")
+# Один клиент на процесс; размер его пула соединений - не меньше потоков STORAGE_POOL
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", str(max(10, executors.STORAGE_POOL_SIZE))))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "30"))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "3"))
+S3_DELETE_BATCH = 1000  # максимум ключей в одном delete_objects
+# Имена объектов уникальны на каждую запись (uuid или sha256) и не перезаписываются -
+# кэш браузера и CDN может быть immutable (и для /static, и для S3)
+STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))
 
-if STORAGE_TYPE == "local":
-    os.makedirs(LOCAL_DIR, exist_ok=True)
+# Контентно-адресуемый режим: имя объекта = sha256 содержимого, одинаковые
+# картинки хранятся один раз, удаление - по счётчику ссылок (таблица stored_objects)
+STORAGE_DEDUP = os.getenv("STORAGE_DEDUP", "0") == "1"
+# <sha256>.<ext> и производные от него <sha256>_<size>.<ext> (содержимое тоже определяется оригиналом)
+CONTENT_NAME_RE = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?\.[A-Za-z0-9]+$")
 
 
-def save_image_local(filename: str, data: bytes) -> str:
-    # Генерация уникального имени
-    ext = os.path.splitext(filename)[1] or ".jpg"
-    name = f"{uuid.uuid4().hex}{ext}"
-    path = os.path.join(LOCAL_DIR, name)
-    with open(path, "wb") as f:
-        f.write(data)
-    # Возвращаем публичный относительный путь — предполагаем, что webserver отдаёт /static/
-    return f"/static/images/{name}"
-
-
-# Optional: S3 uploader (requires boto3)
-def save_image_s3(filename: str, data: bytes) -> str:
-    import boto3
-    if not S3_BUCKET:
-        raise RuntimeError("S3_BUCKET не настроен")
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=S3_ENDPOINT_URL,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION")
-    )
+def _content_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "image/jpeg"
+
+
+class LocalBackend:
+    """Файлы в локальной папке, которую отдаёт /static (и замена S3 в тестах)"""
+
+    def __init__(self, root: str = LOCAL_DIR, url_prefix: str = LOCAL_URL_PREFIX):
+        self.root = root
+        self.url_prefix = url_prefix
+        os.makedirs(root, exist_ok=True)
+
+    def url_for(self, name: str) -> str:
+        return f"{self.url_prefix}{name}"
+
+    def name_from_url(self, public_url: str) -> Optional[str]:
+        # public_url ожидается вида /static/images/<name>
+        path = urlparse(public_url).path
+        if not path.startswith(self.url_prefix):
+            return None
+        return path[len(self.url_prefix):] or None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, os.path.basename(name))
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self._path(name))
+
+    def put(self, name: str, data: bytes) -> str:
+        path = self._path(name)
+        # Пишем во временный файл и переименовываем: читатель не увидит половину картинки
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.url_for(name)
+
+    def remove(self, name: str) -> bool:
+        try:
+            os.remove(self._path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def remove_many(self, names: List[str]) -> int:
+        return sum(1 for name in names if self.remove(name))
+
+
+class S3Backend:
+    """
+    Бакет S3 (Yandex Object Storage). boto3-клиент создаётся лениво один раз
+    и переиспользуется всеми потоками: общий пул соединений, без повторных TLS-рукопожатий.
+    """
+
+    def __init__(self, bucket: str, prefix: str = S3_PREFIX, endpoint_url: str = S3_ENDPOINT_URL,
+                 max_pool_connections: int = S3_MAX_POOL_CONNECTIONS):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.max_pool_connections = max_pool_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+                    self._client = boto3.client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                        region_name=os.getenv("AWS_REGION"),
+                        config=Config(
+                            max_pool_connections=self.max_pool_connections,
+                            connect_timeout=S3_CONNECT_TIMEOUT,
+                            read_timeout=S3_READ_TIMEOUT,
+                            retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"}
+                        )
+                    )
+        return self._client
+
+    def _require_bucket(self):
+        if not self.bucket:
+            raise RuntimeError("S3_BUCKET не настроен")
+
+    def url_for(self, name: str) -> str:
+        return f"https://{self.bucket}.storage.yandexcloud.net/{self.prefix}{name}"
+
+    def name_from_url(self, public_url: str) -> Optional[str]:
+        key = urlparse(public_url).path.lstrip("/")
+        # path-style URL: /<bucket>/<key>
+        if self.bucket and key.startswith(f"{self.bucket}/"):
+            key = key[len(self.bucket) + 1:]
+        if not key.startswith(self.prefix):
+            return None
+        return key[len(self.prefix):] or None
+
+    def exists(self, name: str) -> bool:
+        self._require_bucket()
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=f"{self.prefix}{name}")
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, name: str, data: bytes) -> str:
+        self._require_bucket()
+        self.client.put_object(
+            Bucket=self.bucket, Key=f"{self.prefix}{name}", Body=data,
+            ACL="public-read", ContentType=_content_type(name),
+            CacheControl=f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        )
+        return self.url_for(name)
+
+    def remove(self, name: str) -> bool:
+        self._require_bucket()
+        self.client.delete_object(Bucket=self.bucket, Key=f"{self.prefix}{name}")
+        return True
+
+    def remove_many(self, names: List[str]) -> int:
+        """Удаляет ключи пачками delete_objects по S3_DELETE_BATCH штук"""
+        self._require_bucket()
+        removed = 0
+        for i in range(0, len(names), S3_DELETE_BATCH):
+            chunk = names[i:i + S3_DELETE_BATCH]
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": f"{self.prefix}{n}"} for n in chunk], "Quiet": True}
+            )
+            errors = response.get("Errors") or []
+            for err in errors:
+                logger.warning(f"⚠️ S3 не удалил {err.get('Key')}: {err.get('Code')} {err.get('Message')}")
+            removed += len(chunk) - len(errors)
+        return removed
+
+
+class Storage:
+    """
+    Хранилище картинок поверх бэкенда. Синхронные методы - для потоков и фоновых задач,
+    async-версии выполняются в executors.STORAGE_POOL и не блокируют event loop.
+    """
+
+    def __init__(self, backend, dedup: bool = STORAGE_DEDUP, pool: executors.BoundedPool = None):
+        self.backend = backend
+        self.dedup = dedup
+        self.pool = pool or executors.STORAGE_POOL
+
+    # --- sync ---
+
+    def save_sync(self, filename: str, data: bytes, name: str = None) -> str:
+        """
+        Сохраняет картинку. Без name имя выбирается само (uuid или sha256 в режиме dedup);
+        name задаёт точное имя объекта - например, производные рядом с оригиналом: <stem>_grid.webp
+        """
+        if name is None:
+            if self.dedup:
+                name = content_name(filename, data)
+            else:
+                # Генерация уникального имени
+                name = f"{uuid.uuid4().hex}{os.path.splitext(filename)[1] or '.jpg'}"
+        if self.dedup and CONTENT_NAME_RE.match(name):
+            return self._save_dedup(name, data)
+        return self.backend.put(name, data)
+
+    def stored_name(self, public_url: str) -> Optional[str]:
+        """Имя объекта по его публичному URL"""
+        return self.backend.name_from_url(public_url)
+
+    def delete_sync(self, public_url: str) -> bool:
+        return self.delete_many_sync([public_url]) > 0
+
+    def delete_many_sync(self, public_urls: Iterable[str]) -> int:
+        """Удаляет пачку картинок; возвращает, сколько объектов реально удалено"""
+        names = []
+        removed = 0
+        for url in public_urls:
+            if not url:
+                continue
+            name = self.backend.name_from_url(url)
+            if name is None:
+                logger.warning(f"⚠️ URL не принадлежит хранилищу: {url}")
+                continue
+            if CONTENT_NAME_RE.match(name):
+                # Контентно-адресуемые объекты удаляются только вместе с последней ссылкой
+                remaining = self._release(name)
+                if remaining is not None:
+                    removed += remaining == 0
+                    continue
+            names.append(name)
+        if names:
+            removed += self.backend.remove_many(names)
+        return removed
+
+    # --- async ---
+
+    async def save(self, filename: str, data: bytes, name: str = None) -> str:
+        return await self.pool.run(self.save_sync, filename, data, name)
+
+    async def delete(self, public_url: str) -> bool:
+        return await self.pool.run(self.delete_sync, public_url)
+
+    async def delete_many(self, public_urls: Iterable[str]) -> int:
+        return await self.pool.run(self.delete_many_sync, list(public_urls))
+
+    # --- счётчик ссылок ---
+
+    def _save_dedup(self, name: str, data: bytes) -> str:
+        """
+        Сохраняет картинку под контентным именем (sha256). Если объект уже есть -
+        запись пропускается, увеличивается только счётчик ссылок.
+        """
+        from sqlalchemy.exc import IntegrityError
+        from database import SessionLocal
+        from models import StoredObject
+
+        for _ in range(2):
+            # Объект уже учитывается - короткая транзакция с инкрементом
+            db = SessionLocal()
+            try:
+                obj = db.query(StoredObject).filter(StoredObject.key == name).with_for_update().first()
+                if obj is not None:
+                    obj.refcount += 1
+                    db.commit()
+                    return self.backend.url_for(name)
+            finally:
+                db.close()
+            # Первая ссылка: загрузка в бэкенд (сеть для S3) - без открытой транзакции и занятого соединения.
+            # Объект мог остаться от прошлых загрузок - тогда не перезаписываем
+            if not self.backend.exists(name):
+                self.backend.put(name, data)
+            db = SessionLocal()
+            try:
+                db.add(StoredObject(key=name, refcount=1, size=len(data)))
+                db.commit()
+                return self.backend.url_for(name)
+            except IntegrityError:
+                # Параллельная загрузка того же содержимого успела создать запись - повторяем как инкремент
+                db.rollback()
+            finally:
+                db.close()
+        raise RuntimeError(f"Не удалось сохранить объект {name}")
+
+    def _release(self, name: str):
+        """
+        Уменьшает счётчик ссылок объекта. Возвращает оставшееся число ссылок
+        (объект физически удалён, если 0) или None, если объект не учитывается.
+        """
+        from database import SessionLocal
+        from models import StoredObject
+
+        db = SessionLocal()
+        try:
+            obj = db.query(StoredObject).filter(StoredObject.key == name).with_for_update().first()
+            if obj is None:
+                return None
+            obj.refcount -= 1
+            if obj.refcount > 0:
+                db.commit()
+                return obj.refcount
+            # Последняя ссылка: удаляем объект, пока строка заблокирована
+            self.backend.remove(name)
+            db.delete(obj)
+            db.commit()
+            return 0
+        finally:
+            db.close()
+
+
+def content_name(filename: str, data: bytes) -> str:
     ext = os.path.splitext(filename)[1] or ".jpg"
-    key = f"{S3_PREFIX}{uuid.uuid4().hex}{ext}"
-    s3.put_object(Bucket=S3_BUCKET, Key=key, Body=data, ACL="public-read", ContentType="image/jpeg")
-    # Конструируем публичный URL (пример для AWS)
-    return f"https://{S3_BUCKET}.storage.yandexcloud.net/{key}"
+    return f"{hashlib.sha256(data).hexdigest()}{ext}"
+
+
+def create_backend(storage_type: str = STORAGE_TYPE):
+    if storage_type == "s3":
+        return S3Backend(S3_BUCKET)
+    return LocalBackend()
+
+
+# Общее хранилище приложения
+STORAGE = Storage(create_backend())
 
 
 def save_image(filename: str, data: bytes) -> str:
-    if STORAGE_TYPE == "s3":
-        return save_image_s3(filename, data)
-    return save_image_local(filename, data)
+    return STORAGE.save_sync(filename, data)
 
 
 def delete_image(public_url: str) -> bool:
@@ -58,28 +339,16 @@ def delete_image(public_url: str) -> bool:
        Для локального - удаляем файл, для S3 - удаляем ключ.
     """
     try:
-        if STORAGE_TYPE == "s3":
-            # выдернем ключ из URL (простейший подход)
-            from urllib.parse import urlparse
-            u = urlparse(public_url)
-            key = u.path.lstrip('/')
-            import boto3
-            s3 = boto3.client(
-                "s3",
-                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-                region_name=os.getenv("AWS_REGION")
-            )
-            s3.delete_object(Bucket=S3_BUCKET, Key=key)
-            return True
-        else:
-            # локальный — public_url ожидается вида /static/images/<name>
-            path = public_url.split("/static/")[-1] if "/static/" in public_url else public_url
-            fs_path = os.path.join(os.getcwd(), "static", path)
-            if os.path.exists(fs_path):
-                os.remove(fs_path)
-                return True
-            return False
+        return STORAGE.delete_sync(public_url)
     except Exception as e:
         print("delete_image error:", e)
         return False
+
+
+def delete_images(public_urls: Iterable[str]) -> int:
+    """Пакетное удаление (для S3 - delete_objects по 1000 ключей)"""
+    try:
+        return STORAGE.delete_many_sync(public_urls)
+    except Exception as e:
+        logger.warning("delete_images error: %s", e)
+        return 0
@@ -0,0 +1,164 @@
+# utils/wb_baskets.py
+# Единая карта vol -> basket-XX.wbbasket.ru для скрапера и гардероба.
+# Границы хранятся отсортированным массивом, поиск - bisect (O(log n)).
+# Карта перечитывается из файла при его изменении, поэтому новые корзины WB
+# можно добавить правкой JSON без деплоя; найденные пробами корзины дописываются туда же.
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+WB_BASKET_MAP_PATH = os.getenv("WB_BASKET_MAP_PATH", "data/wb_basket_map.json")
+# Как часто проверять mtime файла карты (секунды)
+WB_BASKET_RELOAD_INTERVAL = float(os.getenv("WB_BASKET_RELOAD_INTERVAL", "30"))
+
+# Пары [верхняя граница vol, корзина]; у последней границы нет (None)
+DEFAULT_WB_BASKET_RANGES = [
+    [143, "01"], [287, "02"], [431, "03"], [719, "04"], [1007, "05"],
+    [1061, "06"], [1115, "07"], [1169, "08"], [1313, "09"], [1601, "10"],
+    [1655, "11"], [1919, "12"], [2045, "13"], [2189, "14"], [2405, "15"],
+    [2621, "16"], [2837, "17"], [3053, "18"], [3269, "19"], [3485, "20"],
+    [3701, "21"], [3917, "22"], [4133, "23"], [4349, "24"], [4565, "25"],
+    [4781, "26"], [4997, "27"], [5213, "28"], [5429, "29"], [None, "30"],
+]
+
+_lock = threading.Lock()
+_uppers = []       # конечные верхние границы, по возрастанию
+_baskets = []      # len(_uppers) + 1, последний элемент - открытый хвост
+_confirmed = {}    # vol -> basket, подтверждённые пробой
+_loaded_mtime = None
+_checked_at = 0.0
+
+
+def _set_ranges(ranges: list):
+    global _uppers, _baskets
+    uppers, baskets = [], []
+    for upper, basket in ranges:
+        if upper is None:
+            break
+        uppers.append(int(upper))
+        baskets.append(basket)
+    baskets.append(ranges[-1][1])
+    _uppers, _baskets = uppers, baskets
+
+
+def _ranges() -> list:
+    return [[u, b] for u, b in zip(_uppers, _baskets)] + [[None, _baskets[-1]]]
+
+
+def _file_mtime():
+    try:
+        return os.stat(WB_BASKET_MAP_PATH).st_mtime
+    except OSError:
+        return None
+
+
+def reload(force: bool = False) -> bool:
+    """Перечитывает карту из файла, если он изменился. Возвращает True, если карта обновлена"""
+    global _loaded_mtime, _checked_at, _confirmed
+    with _lock:
+        _checked_at = time.monotonic()
+        mtime = _file_mtime()
+        if not force and mtime == _loaded_mtime and _baskets:
+            return False
+        ranges, confirmed = DEFAULT_WB_BASKET_RANGES, {}
+        if mtime is not None:
+            try:
+                with open(WB_BASKET_MAP_PATH, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                ranges = data["ranges"]
+                confirmed = {int(k): v for k, v in data.get("confirmed", {}).items()}
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось прочитать карту корзин WB: {e}")
+                if _baskets:
+                    return False
+        _set_ranges(ranges)
+        _confirmed = confirmed
+        _loaded_mtime = mtime
+        return True
+
+
+def _maybe_reload():
+    if not _baskets or time.monotonic() - _checked_at >= WB_BASKET_RELOAD_INTERVAL:
+        reload()
+
+
+def _save():
+    global _loaded_mtime
+    try:
+        folder = os.path.dirname(WB_BASKET_MAP_PATH)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{WB_BASKET_MAP_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "ranges": _ranges(),
+                "confirmed": {str(k): v for k, v in sorted(_confirmed.items())}
+            }, f)
+        os.replace(tmp_path, WB_BASKET_MAP_PATH)
+        # Свою же запись перечитывать не нужно
+        _loaded_mtime = _file_mtime()
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить карту корзин WB: {e}")
+
+
+def basket_for_vol(vol: int) -> str:
+    """Номер корзины ("01".."NN") для vol: подтверждённый или по таблице диапазонов"""
+    _maybe_reload()
+    confirmed = _confirmed.get(vol)
+    if confirmed:
+        return confirmed
+    baskets = _baskets
+    return baskets[bisect_left(_uppers, vol)]
+
+
+def host_for_vol(vol: int) -> str:
+    return f"basket-{basket_for_vol(vol)}.wbbasket.ru"
+
+
+def is_confirmed(vol: int) -> bool:
+    _maybe_reload()
+    return vol in _confirmed
+
+
+def max_known_basket() -> int:
+    _maybe_reload()
+    return max(int(b) for b in _baskets)
+
+
+def record(vol: int, basket: str):
+    """Запоминает найденную пробой корзину и сдвигает границу в таблице диапазонов"""
+    _maybe_reload()
+    with _lock:
+        _confirmed[vol] = basket
+        
+        ranges = _ranges()
+        idx = bisect_left(_uppers, vol)
+        upper, current = ranges[idx]
+        if current != basket:
+            lower = ranges[idx - 1][0] + 1 if idx > 0 else 0
+            # Корзины растут вместе с vol, поэтому граница сдвигается к найденному vol
+            if int(basket) > int(current):
+                replacement = [[vol - 1, current]] if vol > lower else []
+                replacement.append([upper, basket])
+            else:
+                replacement = [[vol, basket]]
+                if upper is None or upper > vol:
+                    replacement.append([upper, current])
+            ranges[idx:idx + 1] = replacement
+            
+            # Склеиваем соседние диапазоны с одинаковой корзиной
+            merged = []
+            for r in ranges:
+                if merged and merged[-1][1] == r[1]:
+                    merged[-1][0] = r[0]
+                else:
+                    merged.append(list(r))
+            _set_ranges(merged)
+            logger.info(f"🗺️ Карта корзин WB обновлена: vol {vol} -> basket-{basket}")
+        
+        _save()